@@ -1,10 +1,22 @@
 import os
+import hmac
 import json
+import time
 import uuid
-from flask import Flask, render_template, request, jsonify, session
+import logging
+from flask import Flask, Response, g, render_template, request, jsonify, send_file, session, stream_with_context
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
-import google.generativeai as genai
-from utils.gemini_helper import generate_ai_response
+from utils.providers import ProviderError, get_provider
+from utils.conversation_store import init_conversation_store
+from utils.context_manager import ContextManager, get_token_budget
+from utils.response_cache import CachedProvider, cache_from_env
+from utils.rate_limit import AdmissionRejected, admission_from_env
+from utils.batch import batch_jobs_from_env
+from utils.rendering import RENDER_VERSION, renderer_from_env
+from utils import metrics
+from utils.metrics import InstrumentedProvider, timed
+from utils.router import router_from_env
 
 # Load environment variables
 load_dotenv()
@@ -13,35 +25,243 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
 
-# Configure Google Gemini API
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    raise ValueError("No API key found. Please set GOOGLE_API_KEY in .env file")
+# Behind a load balancer, take the client address from X-Forwarded-For so per-IP
+# rate limits apply to clients rather than the proxy. Only set this to the number
+# of proxies in front of the app, or clients can spoof their address.
+trusted_proxy_hops = int(os.environ.get('TRUSTED_PROXY_HOPS', '0'))
+if trusted_proxy_hops:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxy_hops, x_proto=trusted_proxy_hops)
 
-genai.configure(api_key=api_key)
+# Providers listed in LLM_PROVIDERS (e.g. "gemini,openai"), or just LLM_PROVIDER, in order of
+# preference; created once and reused. The router picks the healthiest per call.
+provider_names = [name.strip() for name in os.environ.get('LLM_PROVIDERS', '').split(',') if name.strip()]
+router = router_from_env([InstrumentedProvider(get_provider(name)) for name in provider_names or [None]])
+provider = router
+
+# Opt-in response cache in front of the provider (RESPONSE_CACHE=1)
+response_cache = cache_from_env()
+if response_cache is not None:
+    provider = CachedProvider(provider, response_cache)
+
+# Assistant messages are rendered to sanitized HTML once and cached by content hash
+renderer = renderer_from_env()
+
+# Conversations live server-side; the session cookie only carries IDs
+store = init_conversation_store(app)
+
+# Rate limits and the global generation limit for model-calling routes
+admission = admission_from_env()
+
+# Metrics read from other components at scrape time
+metrics.registry.register(metrics.Gauge(
+    'chat_generations_in_flight', 'Generations currently holding a slot', lambda: admission.in_flight))
+metrics.registry.register(metrics.Gauge(
+    'chat_generation_queue_depth', 'Requests waiting for a generation slot', lambda: admission.waiting))
+metrics.registry.register(metrics.Gauge(
+    'llm_circuit_open', 'Whether a provider circuit breaker is refusing calls (0 closed, 1 open or half-open)',
+    lambda: {(item['provider'],): int(item['circuit'] != 'closed') for item in router.stats()}, ('provider',),
+    aggregate='max'))
+metrics.registry.register(metrics.Gauge(
+    'llm_error_rate', 'Share of recent calls that failed, per provider (highest among workers)',
+    lambda: {(item['provider'],): item['error_rate'] for item in router.stats()}, ('provider',),
+    aggregate='max'))
+if renderer is not None:
+    for counter in ('hits', 'misses', 'evictions'):
+        metrics.registry.register(metrics.CallbackCounter(
+            f'render_cache_{counter}_total', f'Rendered-markdown cache {counter}',
+            lambda counter=counter: renderer.stats()[counter]))
+if response_cache is not None:
+    for counter in ('hits', 'misses', 'coalesced', 'evictions'):
+        metrics.registry.register(metrics.CallbackCounter(
+            f'response_cache_{counter}_total', f'Response cache {counter}',
+            lambda counter=counter: response_cache.stats()[counter]))
+
+# Under gunicorn, every worker publishes its metrics so any worker can answer a scrape for all of them
+metrics.share_from_env()
+
+# One structured line per request, emitted when the response (or stream) finishes
+request_log = logging.getLogger('chat.requests')
+request_log.setLevel(logging.INFO)
+request_log.propagate = False
+if not request_log.handlers:
+    request_log.addHandler(logging.StreamHandler())
+
+# Keeps the prompt within the model's token budget using a rolling summary; any
+# routed provider may get the prompt, so use the smallest budget among them
+context_manager = ContextManager(store, provider.summarize, model=provider.model,
+                                 budget=min(get_token_budget(model) for model in router.models))
+
+# Offline batch jobs; only enabled when BATCH_API_TOKEN is set
+batch_jobs = batch_jobs_from_env(provider)
+
+def get_owner_id():
+    """Return the owner ID for the current session, creating one if needed."""
+    # Drop conversation data left in cookies by older versions
+    session.pop('conversations', None)
+
+    owner_id = session.get('owner_id')
+    if not owner_id:
+        owner_id = str(uuid.uuid4())
+        session['owner_id'] = owner_id
+    return owner_id
+
+# Messages returned per page when loading conversation history
+MESSAGE_PAGE_SIZE = int(os.environ.get('MESSAGE_PAGE_SIZE', '50'))
+MAX_MESSAGE_PAGE_SIZE = 200
+
+# Part of every ETag, so clients refetch pages when the rendered HTML changes
+RENDER_TAG = f"r{RENDER_VERSION}" if renderer is not None and renderer.available else "r0"
+
+def render_html(content):
+    """Return the rendered HTML for assistant message content, or None to render in the browser."""
+    if renderer is None:
+        return None
+    return renderer.render(content)
+
+def public_message(message):
+    """
+    Return the client-facing fields of a stored message.
+    
+    Assistant messages also carry 'html' (sanitized, highlighted markup) when
+    server-side rendering is enabled, so the browser only has to insert it.
+    """
+    result = {'id': message['id'], 'role': message['role'], 'content': message['content']}
+    if message['role'] == 'assistant':
+        result['html'] = render_html(message['content'])
+    return result
+
+def message_page(owner_id, conversation_id, before=None, limit=MESSAGE_PAGE_SIZE):
+    """
+    Load one page of messages, newest first by cursor.
+    
+    Returns:
+        Dict with 'messages' (oldest first), 'has_more' and 'next_cursor'
+        (pass as 'before' to fetch the previous page), or None if the
+        conversation doesn't exist
+    """
+    with timed('store_load'):
+        page = store.get_messages(owner_id, conversation_id, before=before, limit=limit)
+    if page is None:
+        return None
+    messages, has_more = page
+    with timed('render'):
+        messages_out = [public_message(message) for message in messages]
+    return {
+        'messages': messages_out,
+        'has_more': has_more,
+        'next_cursor': messages[0]['id'] if has_more and messages else None
+    }
+
+def conversation_page(owner_id, conversation_id):
+    """Return a conversation's ID and title with its newest page of messages, or None."""
+    header = store.get_header(owner_id, conversation_id)
+    if header is None:
+        return None
+    result = {'id': header['id'], 'title': header['title']}
+    result.update(message_page(owner_id, conversation_id))
+    return result
+
+def conditional_json(etag, build_payload):
+    """
+    Return build_payload() as JSON tagged with etag, or 304 if the client has it.
+    
+    build_payload is only called when the client's copy is stale, so an
+    unchanged conversation costs a header lookup and no message reads.
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        payload = build_payload()
+        with timed('serialize'):
+            response = jsonify(payload)
+    response.set_etag(etag)
+    # Let browsers cache, but always revalidate with If-None-Match
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def conversations_by_id(owner_id):
+    """Return the owner's conversation titles keyed by conversation ID."""
+    return {item['id']: {'title': item['title']} for item in store.list_conversations(owner_id)}
+
+@app.before_request
+def begin_request():
+    """Assign a request ID and start timing."""
+    metrics.start_request(request.headers.get('X-Request-ID') or uuid.uuid4().hex)
+
+@app.after_request
+def finish_request(response):
+    """Tag the response with its request ID and log it once the body has been sent."""
+    response.headers['X-Request-ID'] = g.request_id
+    endpoint = request.endpoint or 'unknown'
+    entry = {
+        'request_id': g.request_id,
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+    }
+    start = g.request_start
+    timings = g.timings
+    
+    def log_request():
+        duration = time.perf_counter() - start
+        metrics.REQUESTS.inc(endpoint=endpoint, status=entry['status'])
+        metrics.REQUEST_SECONDS.observe(duration, endpoint=endpoint)
+        entry['duration_ms'] = round(duration * 1000, 2)
+        entry.update(timings)
+        request_log.info(json.dumps(entry))
+    
+    response.call_on_close(log_request)
+    return response
+
+def error_response(e):
+    """Log and count an unexpected route error, and return a 500 response."""
+    metrics.APP_ERRORS.inc(endpoint=request.endpoint or 'unknown', exception=type(e).__name__)
+    app.logger.exception("Request %s failed", g.get('request_id'))
+    return jsonify({'error': str(e)}), 500
+
+def admit_generation():
+    """
+    Apply rate limits and take a generation slot for the current request.
+
+    Returns:
+        GenerationSlot that must be released when the generation ends
+
+    Raises:
+        AdmissionRejected: If the request is rate limited or the server is saturated
+    """
+    admission.check_rate(get_owner_id(), request.remote_addr or 'unknown')
+    return admission.acquire()
+
+@app.errorhandler(AdmissionRejected)
+def handle_admission_rejected(e):
+    """Tell the client to back off instead of queueing more work."""
+    response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
 
 @app.route('/')
 def index():
     """Render the main chat interface."""
-    # Initialize session data if it doesn't exist
-    if 'conversations' not in session:
-        session['conversations'] = {}
-        # Create a default conversation
-        default_conversation_id = str(uuid.uuid4())
-        session['conversations'][default_conversation_id] = {
-            'title': 'New conversation',
-            'messages': []
-        }
+    owner_id = get_owner_id()
+    conversations = conversations_by_id(owner_id)
+
+    # Create a default conversation if the owner doesn't have any
+    if not conversations:
+        default_conversation_id = store.create_conversation(owner_id)
+        conversations = conversations_by_id(owner_id)
         session['active_conversation'] = default_conversation_id
-        session.modified = True
+    elif session.get('active_conversation') not in conversations:
+        session['active_conversation'] = next(iter(conversations))
     
     return render_template('index.html', 
-                          conversations=session['conversations'],
+                          conversations=conversations,
                           active_conversation=session.get('active_conversation'))
 
 @app.route('/api/send_message', methods=['POST'])
 def send_message():
     """Handle sending messages to the AI and receiving responses."""
+    slot = admit_generation()
     try:
         data = request.json
         message = data.get('message', '').strip()
@@ -50,96 +270,195 @@ def send_message():
         if not message:
             return jsonify({'error': 'Message cannot be empty'}), 400
         
-        if not conversation_id or conversation_id not in session.get('conversations', {}):
+        owner_id = get_owner_id()
+        # Messages already folded into the summary aren't needed for the prompt
+        with timed('store_load'):
+            conversation = store.get_conversation(owner_id, conversation_id, unsummarized_only=True)
+        if conversation is None:
             return jsonify({'error': 'Invalid conversation ID'}), 400
         
         # Add user message to conversation history
-        user_message = {
-            'role': 'user',
-            'content': message
-        }
-        
-        # Get conversation history
-        conversation = session['conversations'][conversation_id]
+        user_message = store.append_message(owner_id, conversation_id, 'user', message)
         conversation['messages'].append(user_message)
         
         # If this is the first message, update the conversation title
-        if len(conversation['messages']) == 1:
+        if len(conversation['messages']) == 1 and not conversation['summary_upto']:
             conversation['title'] = message[:30] + ('...' if len(message) > 30 else '')
+            store.set_title(owner_id, conversation_id, conversation['title'])
         
-        # Generate AI response
-        messages = conversation['messages'].copy()
-        response = generate_ai_response(messages)
+        # Generate AI response from the budgeted context
+        with timed('prompt_build'):
+            messages = context_manager.build(owner_id, conversation)
+        # Don't hold a database connection while waiting on the model
+        store.release()
+        try:
+            response = provider.generate(messages)
+        except ProviderError as e:
+            # Failed generations are never stored as assistant messages
+            app.logger.error("AI response failed: %s", e)
+            return jsonify({
+                'error': f'The AI service is unavailable: {e}',
+                'messages': [public_message(user_message)],
+                'conversation': {'id': conversation_id, 'title': conversation['title']}
+            }), 502
         
         # Add AI response to conversation history
-        ai_message = {
-            'role': 'assistant',
-            'content': response
-        }
+        ai_message = store.append_message(owner_id, conversation_id, 'assistant', response)
         conversation['messages'].append(ai_message)
         
-        # Update session
-        session.modified = True
+        # Only the new messages are returned; older history is already on the client
+        with timed('render'):
+            messages_out = [public_message(user_message), public_message(ai_message)]
+        with timed('serialize'):
+            return jsonify({
+                'status': 'success',
+                'response': response,
+                'messages': messages_out,
+                'conversation': {'id': conversation_id, 'title': conversation['title']}
+            })
+    
+    except Exception as e:
+        return error_response(e)
+    
+    finally:
+        slot.release()
+
+@app.route('/api/send_message_stream', methods=['POST'])
+def send_message_stream():
+    """
+    Stream the AI response as newline-delimited JSON events.
+
+    Events are {"type": "start"}, then one {"type": "delta", "text": ...} per
+    provider chunk, then {"type": "done"} or {"type": "error"}. The assistant
+    message is persisted once, when the stream completes or the client
+    disconnects mid-stream.
+    """
+    # The slot is held until the stream ends, not just until this view returns
+    slot = admit_generation()
+    try:
+        data = request.json
+        message = data.get('message', '').strip()
+        conversation_id = data.get('conversation_id')
         
-        return jsonify({
-            'status': 'success',
-            'response': response,
-            'conversation': conversation
-        })
+        if not message:
+            return jsonify({'error': 'Message cannot be empty'}), 400
+        
+        owner_id = get_owner_id()
+        # Messages already folded into the summary aren't needed for the prompt
+        with timed('store_load'):
+            conversation = store.get_conversation(owner_id, conversation_id, unsummarized_only=True)
+        if conversation is None:
+            return jsonify({'error': 'Invalid conversation ID'}), 400
+        
+        # Add user message to conversation history
+        user_message = store.append_message(owner_id, conversation_id, 'user', message)
+        conversation['messages'].append(user_message)
+        
+        # If this is the first message, update the conversation title
+        if len(conversation['messages']) == 1 and not conversation['summary_upto']:
+            conversation['title'] = message[:30] + ('...' if len(message) > 30 else '')
+            store.set_title(owner_id, conversation_id, conversation['title'])
+        
+        with timed('prompt_build'):
+            messages = context_manager.build(owner_id, conversation)
+        # Don't hold a database connection while the response streams
+        store.release()
     
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        slot.release()
+        return error_response(e)
+    
+    def event(payload):
+        return json.dumps(payload) + '\n'
+    
+    def generate():
+        chunks = []
+        persisted = False
+        try:
+            yield event({
+                'type': 'start',
+                'conversation_id': conversation_id,
+                'title': conversation['title']
+            })
+            
+            for text in provider.stream(messages):
+                chunks.append(text)
+                yield event({'type': 'delta', 'text': text})
+            
+            # Persist the complete response before telling the client we're done
+            response = ''.join(chunks)
+            store.append_message(owner_id, conversation_id, 'assistant', response)
+            persisted = True
+            # Rendered once here; later page loads hit the render cache
+            with timed('render'):
+                html = render_html(response)
+            yield event({'type': 'done', 'response': response, 'html': html,
+                         'title': conversation['title']})
+        
+        except GeneratorExit:
+            # Client went away: keep whatever was generated so far, unless the
+            # complete reply is already stored
+            if chunks and not persisted:
+                store.append_message(owner_id, conversation_id, 'assistant', ''.join(chunks))
+            raise
+        
+        except Exception as e:
+            yield event({'type': 'error', 'error': str(e)})
+        
+        finally:
+            slot.release()
+    
+    response = Response(stream_with_context(generate()),
+                        mimetype='application/x-ndjson',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Also release if the response is closed before the stream ever starts
+    response.call_on_close(slot.release)
+    return response
 
 @app.route('/api/create_conversation', methods=['POST'])
 def create_conversation():
     """Create a new conversation."""
     try:
-        # Generate a unique ID for the new conversation
-        conversation_id = str(uuid.uuid4())
-        
-        # Initialize the new conversation
-        if 'conversations' not in session:
-            session['conversations'] = {}
+        owner_id = get_owner_id()
         
-        session['conversations'][conversation_id] = {
-            'title': 'New conversation',
-            'messages': []
-        }
+        # Create the new conversation in the store
+        conversation_id = store.create_conversation(owner_id)
         
         # Set this as the active conversation
         session['active_conversation'] = conversation_id
-        session.modified = True
         
         return jsonify({
             'status': 'success',
             'conversation_id': conversation_id,
-            'conversation': session['conversations'][conversation_id]
+            'conversation': conversation_page(owner_id, conversation_id)
         })
     
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
 
 @app.route('/api/switch_conversation', methods=['POST'])
 def switch_conversation():
-    """Switch to a different conversation."""
+    """
+    Make a conversation the active one.
+    
+    Only updates the session; the client loads the conversation itself from
+    GET /api/conversations/<id>, which the browser can revalidate by ETag.
+    """
     try:
         data = request.json
         conversation_id = data.get('conversation_id')
         
-        if not conversation_id or conversation_id not in session.get('conversations', {}):
+        owner_id = get_owner_id()
+        if not store.has_conversation(owner_id, conversation_id):
             return jsonify({'error': 'Invalid conversation ID'}), 400
         
         # Set as the active conversation
         session['active_conversation'] = conversation_id
-        session.modified = True
         
-        return jsonify({
-            'status': 'success',
-            'conversation': session['conversations'][conversation_id]
-        })
+        return jsonify({'status': 'success'})
     
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
 
 @app.route('/api/delete_conversation', methods=['POST'])
 def delete_conversation():
@@ -148,36 +467,33 @@ def delete_conversation():
         data = request.json
         conversation_id = data.get('conversation_id')
         
-        if not conversation_id or conversation_id not in session.get('conversations', {}):
+        owner_id = get_owner_id()
+        if not store.has_conversation(owner_id, conversation_id):
             return jsonify({'error': 'Invalid conversation ID'}), 400
         
         # Delete the conversation
-        del session['conversations'][conversation_id]
+        store.delete_conversation(owner_id, conversation_id)
+        conversations = conversations_by_id(owner_id)
         
         # If we deleted the active conversation, set a new active conversation
-        if session.get('active_conversation') == conversation_id:
-            if session['conversations']:
+        if session.get('active_conversation') not in conversations:
+            if conversations:
                 # Set first available conversation as active
-                session['active_conversation'] = next(iter(session['conversations']))
+                session['active_conversation'] = next(iter(conversations))
             else:
                 # Create a new conversation if none exist
-                new_conversation_id = str(uuid.uuid4())
-                session['conversations'][new_conversation_id] = {
-                    'title': 'New conversation',
-                    'messages': []
-                }
-                session['active_conversation'] = new_conversation_id
-        
-        session.modified = True
+                session['active_conversation'] = store.create_conversation(owner_id)
+                conversations = conversations_by_id(owner_id)
         
         return jsonify({
             'status': 'success',
             'active_conversation': session['active_conversation'],
-            'conversations': session['conversations']
+            'conversations': conversations,
+            'conversation': conversation_page(owner_id, session['active_conversation'])
         })
     
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
 
 @app.route('/api/clear_conversation', methods=['POST'])
 def clear_conversation():
@@ -186,40 +502,142 @@ def clear_conversation():
         data = request.json
         conversation_id = data.get('conversation_id')
         
-        if not conversation_id or conversation_id not in session.get('conversations', {}):
+        owner_id = get_owner_id()
+        if not store.has_conversation(owner_id, conversation_id):
             return jsonify({'error': 'Invalid conversation ID'}), 400
         
         # Clear the messages
-        session['conversations'][conversation_id]['messages'] = []
-        session['conversations'][conversation_id]['title'] = 'New conversation'
-        session.modified = True
+        store.clear_conversation(owner_id, conversation_id)
         
         return jsonify({
             'status': 'success',
-            'conversation': session['conversations'][conversation_id]
+            'conversation': conversation_page(owner_id, conversation_id)
         })
     
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
 
 @app.route('/api/conversations', methods=['GET'])
 def get_conversations():
     """Get all conversations."""
     try:
-        if 'conversations' not in session:
-            return jsonify([])
-            
-        result = []
-        for id, conversation in session['conversations'].items():
-            result.append({
-                'id': id,
-                'title': conversation['title']
-            })
-            
-        return jsonify(result)
+        # Reads only the indexed conversation headers, never the messages
+        return jsonify(store.list_conversations(get_owner_id()))
+    
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/conversations/<conversation_id>', methods=['GET'])
+def get_conversation(conversation_id):
+    """Get a conversation with its newest page of messages. Supports If-None-Match."""
+    try:
+        owner_id = get_owner_id()
+        header = store.get_header(owner_id, conversation_id)
+        if header is None:
+            return jsonify({'error': 'Invalid conversation ID'}), 404
+        
+        return conditional_json(f"{header['version']}-{MESSAGE_PAGE_SIZE}-{RENDER_TAG}",
+                                lambda: conversation_page(owner_id, conversation_id))
     
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
+
+@app.route('/api/conversations/<conversation_id>/messages', methods=['GET'])
+def get_conversation_messages(conversation_id):
+    """
+    Get one page of messages, newest first by cursor. Supports If-None-Match.
+    
+    Query parameters: before (cursor from next_cursor) and limit.
+    """
+    try:
+        before = request.args.get('before', type=int)
+        limit = min(request.args.get('limit', MESSAGE_PAGE_SIZE, type=int), MAX_MESSAGE_PAGE_SIZE)
+        if limit < 1:
+            return jsonify({'error': 'Invalid limit'}), 400
+        
+        owner_id = get_owner_id()
+        header = store.get_header(owner_id, conversation_id)
+        if header is None:
+            return jsonify({'error': 'Invalid conversation ID'}), 404
+        
+        return conditional_json(f"{header['version']}-{before or ''}-{limit}-{RENDER_TAG}",
+                                lambda: message_page(owner_id, conversation_id, before=before, limit=limit))
+    
+    except Exception as e:
+        return error_response(e)
+
+def check_batch_access():
+    """Return an error response unless batch jobs are enabled and the bearer token matches BATCH_API_TOKEN."""
+    if batch_jobs is None:
+        return jsonify({'error': 'Batch jobs are disabled'}), 404
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(token.encode(), os.environ['BATCH_API_TOKEN'].encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return None
+
+@app.route('/api/batch', methods=['POST'])
+def create_batch():
+    """
+    Start a batch job from a JSONL body of conversations.
+    
+    Each line holds 'messages', 'prompt' or a requests.jsonl-style record.
+    Requires 'Authorization: Bearer <BATCH_API_TOKEN>'.
+    """
+    denied = check_batch_access()
+    if denied:
+        return denied
+    try:
+        try:
+            job_id = batch_jobs.create(request.get_data(as_text=True).splitlines())
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({'error': f'Invalid batch input: {e}'}), 400
+        
+        return jsonify(batch_jobs.status(job_id)), 202
+    
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/batch/<job_id>', methods=['GET'])
+def get_batch(job_id):
+    """Get a batch job's state, progress and throughput."""
+    denied = check_batch_access()
+    if denied:
+        return denied
+    status = batch_jobs.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Invalid job ID'}), 404
+    return jsonify(status)
+
+@app.route('/api/batch/<job_id>/results', methods=['GET'])
+def get_batch_results(job_id):
+    """Download a batch job's results so far as JSONL."""
+    denied = check_batch_access()
+    if denied:
+        return denied
+    if batch_jobs.status(job_id) is None:
+        return jsonify({'error': 'Invalid job ID'}), 404
+    path = batch_jobs.output_path(job_id)
+    if not os.path.exists(path):
+        return Response('', mimetype='application/x-ndjson')
+    return send_file(os.path.abspath(path), mimetype='application/x-ndjson')
+
+@app.route('/api/batch/<job_id>/resume', methods=['POST'])
+def resume_batch(job_id):
+    """Resume an interrupted batch job, skipping items that already succeeded."""
+    denied = check_batch_access()
+    if denied:
+        return denied
+    status = batch_jobs.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Invalid job ID'}), 404
+    if not batch_jobs.start(job_id):
+        return jsonify({'error': 'Job is already running'}), 409
+    return jsonify(batch_jobs.status(job_id)), 202
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Expose metrics in Prometheus text format."""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,44 @@
+"""
+Run a JSONL file of conversations through the configured LLM provider.
+
+    python batch.py input.jsonl output.jsonl --workers 8 --rate 5
+
+Each output line is a JSON object with the item's id, response (or error)
+and latency. Re-running with the same output file resumes an interrupted
+run without repeating finished items.
+"""
+import sys
+import logging
+import argparse
+
+from dotenv import load_dotenv
+
+from utils.batch import BatchRunner
+from utils.providers import get_provider
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-generate responses for a JSONL file of conversations.")
+    parser.add_argument('input', help="JSONL file with 'messages', 'prompt' or requests.jsonl-style records")
+    parser.add_argument('output', help="JSONL file to append results to (also the resume checkpoint)")
+    parser.add_argument('--workers', type=int, default=4, help="concurrent provider calls (default: 4)")
+    parser.add_argument('--rate', type=float, default=0,
+                        help="maximum requests per second, 0 for unlimited (default: 0)")
+    parser.add_argument('--provider', help="provider name, overriding LLM_PROVIDER")
+    parser.add_argument('--progress-interval', type=float, default=10,
+                        help="seconds between progress reports (default: 10)")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    runner = BatchRunner(get_provider(args.provider), workers=args.workers, rate_per_second=args.rate,
+                         progress_interval=args.progress_interval)
+    stats = runner.run(args.input, args.output)
+    print(f"Done: {stats['succeeded']} succeeded, {stats['failed']} failed, {stats['skipped']} skipped "
+          f"in {stats['elapsed_s']}s ({stats['items_per_s']} items/s)")
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
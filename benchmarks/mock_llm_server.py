@@ -0,0 +1,250 @@
+"""
+Local mock of the OpenAI and Gemini HTTP APIs for benchmarks.
+
+Serves OpenAI chat completions (plain and SSE streaming) and Gemini
+generateContent / streamGenerateContent over REST, with configurable
+latency, streaming speed and error injection. Point the app at it with:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock LLM_PROVIDER=openai
+    GEMINI_BASE_URL=http://127.0.0.1:8001 GOOGLE_API_KEY=mock LLM_PROVIDER=gemini
+
+Run with:
+
+    python benchmarks/mock_llm_server.py --port 8001 --latency 0.5 --tokens-per-second 50
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("the", "model", "response", "token", "stream", "latency", "cache", "request", "worker",
+         "context", "summary", "provider", "benchmark", "message", "conversation", "budget")
+
+
+class MockConfig:
+    """Behaviour of the mock server; shared by every handler thread."""
+
+    def __init__(self, latency=0.3, jitter=0.1, tokens_per_second=100.0, response_tokens=120,
+                 error_rate=0.0, error_statuses=(503,), drop_rate=0.0, seed=0):
+        """
+        Args:
+            latency: Seconds before the first token
+            jitter: Extra random latency, uniform in [0, jitter] seconds
+            tokens_per_second: Streaming speed (0 sends every token at once)
+            response_tokens: Words per response
+            error_rate: Share of requests answered with an error status
+            error_statuses: Statuses to choose from for injected errors
+            drop_rate: Share of streams cut off halfway through
+            seed: Seed for the random generator
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.drop_rate = drop_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'dropped': 0}
+
+    def roll(self):
+        """Return (first-token delay, error status or None, drop stream?) for one request."""
+        with self._lock:
+            self.stats['requests'] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            status = None
+            if self._random.random() < self.error_rate:
+                status = self._random.choice(self.error_statuses)
+                self.stats['errors'] += 1
+            drop = status is None and self._random.random() < self.drop_rate
+            if drop:
+                self.stats['dropped'] += 1
+            return delay, status, drop
+
+    def tokens(self, prompt):
+        # Deterministic per prompt, like the app's fake provider
+        rng = random.Random(prompt)
+        return [rng.choice(WORDS) + " " for _ in range(self.response_tokens)]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _paced(self, tokens, drop):
+        """Yield tokens at the configured speed; stops halfway (and closes) if drop is set."""
+        interval = 1 / self.config.tokens_per_second if self.config.tokens_per_second else 0
+        cutoff = len(tokens) // 2 if drop else len(tokens)
+        for index, token in enumerate(tokens[:cutoff]):
+            if interval and index:
+                time.sleep(interval)
+            yield token
+        if drop:
+            self.close_connection = True
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif self.path == '/stats':
+            self._send_json(200, self.config.stats)
+        else:
+            self._send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        request = json.loads(self.rfile.read(length) or b'{}')
+        path = self.path.split('?')[0]
+
+        if path.endswith('/chat/completions'):
+            handler = self._openai
+        elif path.endswith(':generateContent') or path.endswith(':streamGenerateContent'):
+            handler = self._gemini
+        else:
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+
+        delay, status, drop = self.config.roll()
+        time.sleep(delay)
+        if status is not None:
+            self.send_response(status)
+            body = json.dumps({'error': {'code': status, 'message': 'Injected error'}}).encode('utf-8')
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            if status == 429:
+                self.send_header('Retry-After', '1')
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        handler(request, path, drop)
+
+    def _openai(self, request, path, drop):
+        messages = request.get('messages') or [{}]
+        prompt = messages[-1].get('content', '')
+        tokens = self.config.tokens(prompt)
+        prompt_tokens = sum(len(msg.get('content', '')) for msg in messages) // 4
+        base = {'id': 'chatcmpl-mock', 'created': int(time.time()), 'model': request.get('model', 'mock')}
+
+        if not request.get('stream'):
+            self._send_json(200, dict(base, object='chat.completion', choices=[{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                'finish_reason': 'stop',
+            }], usage={'prompt_tokens': prompt_tokens, 'completion_tokens': len(tokens),
+                       'total_tokens': prompt_tokens + len(tokens)}))
+            return
+
+        self._start_chunked('text/event-stream')
+        for token in self._paced(tokens, drop):
+            chunk = dict(base, object='chat.completion.chunk', choices=[{
+                'index': 0, 'delta': {'content': token}, 'finish_reason': None}])
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+        if drop:
+            return
+        final = dict(base, object='chat.completion.chunk', choices=[{
+            'index': 0, 'delta': {}, 'finish_reason': 'stop'}])
+        self._write_chunk(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n")
+        self._end_chunked()
+
+    @staticmethod
+    def _gemini_response(text, finished):
+        response = {'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}, 'index': 0}]}
+        if finished:
+            # 1 is STOP; the REST client asks for integer enums
+            response['candidates'][0]['finishReason'] = 1
+        return response
+
+    def _gemini(self, request, path, drop):
+        contents = request.get('contents') or [{}]
+        parts = contents[-1].get('parts') or [{}]
+        tokens = self.config.tokens(parts[0].get('text', ''))
+
+        if path.endswith(':generateContent'):
+            self._send_json(200, self._gemini_response(''.join(tokens), True))
+            return
+
+        # The REST client reads streamed responses as one JSON array
+        self._start_chunked('application/json')
+        self._write_chunk('[')
+        for index, token in enumerate(self._paced(tokens, drop)):
+            separator = ',\r\n' if index else ''
+            self._write_chunk(separator + json.dumps(self._gemini_response(token, False)))
+        if drop:
+            return
+        self._write_chunk(',\r\n' + json.dumps(self._gemini_response('', True)) + ']')
+        self._end_chunked()
+
+
+def serve(config, host='127.0.0.1', port=8001):
+    """
+    Create the mock server; call serve_forever() on the result to run it.
+
+    Returns:
+        ThreadingHTTPServer bound to host:port
+    """
+    handler = type('ConfiguredMockHandler', (MockHandler,), {'config': config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock OpenAI/Gemini API server for benchmarks.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument('--jitter', type=float, default=0.1, help="extra random latency in seconds")
+    parser.add_argument('--tokens-per-second', type=float, default=100, help="streaming speed (0 for instant)")
+    parser.add_argument('--response-tokens', type=int, default=120, help="words per response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests that get an error")
+    parser.add_argument('--error-statuses', default='503', help="comma-separated statuses for injected errors")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="share of streams cut off midway")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    config = MockConfig(
+        latency=args.latency, jitter=args.jitter, tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens, error_rate=args.error_rate,
+        error_statuses=[int(status) for status in args.error_statuses.split(',')],
+        drop_rate=args.drop_rate, seed=args.seed,
+    )
+    server = serve(config, args.host, args.port)
+    print(f"Mock LLM server listening on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
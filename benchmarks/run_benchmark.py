@@ -0,0 +1,479 @@
+"""
+Benchmark the chat app end to end against the local mock LLM server.
+
+Starts the mock server and the app (gunicorn with gevent workers, as in
+production), replays multi-turn conversations seeded from requests.jsonl at
+each concurrency level, and saves the results as JSON:
+
+    python benchmarks/run_benchmark.py --concurrency 1,8,32 --conversations 64 --turns 6
+
+Reported per level: requests per second, p50/p95/p99 latency,
+time-to-first-token, errors by kind, per-worker RSS, and by turn number
+the streamed response, history page and cookie sizes. Compare two runs
+with --compare baseline.json.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import signal
+import socket
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FOLLOW_UPS = (
+    "Can you expand on this part: {sentence}",
+    "What are the trade-offs of this? {sentence}",
+    "How would you test this? {sentence}",
+    "Show a short code example for: {sentence}",
+    "What could go wrong here? {sentence}",
+)
+
+
+def percentile(values, q):
+    """Return the q-th quantile (0-100) of values by nearest rank, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def distribution(values, scale=1000):
+    """Summarize values (seconds) as milliseconds."""
+    if not values:
+        return None
+    return {
+        'p50': round(percentile(values, 50) * scale, 2),
+        'p95': round(percentile(values, 95) * scale, 2),
+        'p99': round(percentile(values, 99) * scale, 2),
+        'mean': round(sum(values) / len(values) * scale, 2),
+        'max': round(max(values) * scale, 2),
+    }
+
+
+def load_workload(path, conversations, turns, seed):
+    """
+    Build multi-turn conversations from a requests.jsonl-style file.
+
+    The first turn of each conversation is a request's title and body; later
+    turns are follow-up questions about sentences from the body.
+
+    Returns:
+        List of conversations, each a list of user messages
+    """
+    with open(path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records:
+        raise ValueError(f"No records in {path}")
+
+    rng = random.Random(seed)
+    workload = []
+    for index in range(conversations):
+        record = records[index % len(records)]
+        body = record.get('body') or record.get('prompt') or ''
+        messages = [f"{record.get('title', '')}\n\n{body}".strip()]
+        sentences = [s.strip() + '.' for s in body.split('. ') if len(s.strip()) > 20] or [body[:200]]
+        for _ in range(turns - 1):
+            messages.append(rng.choice(FOLLOW_UPS).format(sentence=rng.choice(sentences)))
+        workload.append(messages)
+    return workload
+
+
+class AppClient:
+    """One virtual user: a keep-alive connection and its own cookie jar."""
+
+    def __init__(self, base_url, timeout=120):
+        parts = urlsplit(base_url)
+        self._connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+        self.cookies = {}
+
+    def cookie_header(self):
+        return '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+
+    def _send(self, method, path, payload=None):
+        headers = {'Cookie': self.cookie_header()} if self.cookies else {}
+        body = None
+        if payload is not None:
+            body = json.dumps(payload)
+            headers['Content-Type'] = 'application/json'
+        self._connection.request(method, path, body=body, headers=headers)
+        response = self._connection.getresponse()
+        for header in response.msg.get_all('Set-Cookie') or []:
+            name, _, rest = header.partition('=')
+            self.cookies[name.strip()] = rest.split(';', 1)[0]
+        return response
+
+    def request(self, method, path, payload=None):
+        """Return (status, body bytes)."""
+        response = self._send(method, path, payload)
+        return response.status, response.read()
+
+    def stream_message(self, conversation_id, message):
+        """
+        Send a message to the streaming endpoint and read the whole stream.
+
+        Returns:
+            Dict with status, latency, ttft (seconds to the first delta),
+            bytes received and error (None on success)
+        """
+        start = time.perf_counter()
+        response = self._send('POST', '/api/send_message_stream',
+                              {'message': message, 'conversation_id': conversation_id})
+        result = {'status': response.status, 'ttft': None, 'bytes': 0, 'error': None}
+        if response.status != 200:
+            result['bytes'] = len(response.read())
+            result['error'] = f'http_{response.status}'
+        else:
+            finished = False
+            while True:
+                line = response.readline()
+                if not line:
+                    break
+                result['bytes'] += len(line)
+                event = json.loads(line)
+                if event['type'] == 'delta' and result['ttft'] is None:
+                    result['ttft'] = time.perf_counter() - start
+                elif event['type'] == 'done':
+                    finished = True
+                elif event['type'] == 'error':
+                    result['error'] = 'stream_error'
+            if not finished and result['error'] is None:
+                result['error'] = 'incomplete_stream'
+        result['latency'] = time.perf_counter() - start
+        return result
+
+    def close(self):
+        self._connection.close()
+
+
+def run_conversation(base_url, messages):
+    """Replay one conversation and return a record per turn."""
+    client = AppClient(base_url)
+    records = []
+    try:
+        client.request('GET', '/')
+        status, body = client.request('POST', '/api/create_conversation', {})
+        if status != 200:
+            return [{'turn': 0, 'status': status, 'error': f'http_{status}', 'latency': 0, 'ttft': None,
+                     'bytes': 0, 'page_bytes': 0, 'cookie_bytes': len(client.cookie_header())}]
+        conversation_id = json.loads(body)['conversation_id']
+
+        for turn, message in enumerate(messages):
+            try:
+                record = client.stream_message(conversation_id, message)
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                # The connection is unusable; count the failure and drop the rest of the conversation
+                records.append({'turn': turn, 'status': None, 'error': type(e).__name__, 'latency': 0,
+                                'ttft': None, 'bytes': 0, 'page_bytes': 0, 'cookie_bytes': 0})
+                break
+            # History as the client would load it on switching back to this conversation
+            _, page = client.request('GET', f'/api/conversations/{conversation_id}')
+            record.update(turn=turn, page_bytes=len(page), cookie_bytes=len(client.cookie_header()))
+            records.append(record)
+        return records
+    finally:
+        client.close()
+
+
+def worker_pids(master_pid):
+    """Return the PIDs of a process's children (the gunicorn workers), read from /proc."""
+    pids = []
+    try:
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # The command name may contain spaces; the parent PID follows the closing paren
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            if ppid == master_pid:
+                pids.append(int(entry))
+    except OSError:
+        pass
+    return sorted(pids)
+
+
+def rss_mb(pid):
+    """Return a process's resident set size in MB, or None if unavailable."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler:
+    """Samples the RSS of a set of processes in the background, keeping the peak per PID."""
+
+    def __init__(self, pids, interval=0.5):
+        self.pids = pids
+        self.interval = interval
+        self.peak = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        for pid in self.pids:
+            value = rss_mb(pid)
+            if value is not None:
+                self.peak[pid] = max(self.peak.get(pid, 0), value)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    def result(self):
+        return {str(pid): {'peak_mb': self.peak.get(pid), 'end_mb': rss_mb(pid)} for pid in self.pids}
+
+
+def run_level(base_url, workload, concurrency, pids):
+    """Replay the workload with concurrency simultaneous users and summarize the results."""
+    with RssSampler(pids) as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            conversations = list(executor.map(lambda messages: run_conversation(base_url, messages), workload))
+        elapsed = time.perf_counter() - start
+
+    records = [record for conversation in conversations for record in conversation]
+    ok = [record for record in records if record['error'] is None]
+    errors = {}
+    for record in records:
+        if record['error'] is not None:
+            errors[record['error']] = errors.get(record['error'], 0) + 1
+
+    by_turn = []
+    for turn in range(max((record['turn'] for record in records), default=-1) + 1):
+        turn_records = [record for record in ok if record['turn'] == turn]
+        if not turn_records:
+            continue
+        by_turn.append({
+            'turn': turn,
+            'requests': len(turn_records),
+            'latency_ms': distribution([record['latency'] for record in turn_records]),
+            'stream_bytes': round(sum(r['bytes'] for r in turn_records) / len(turn_records)),
+            'page_bytes': round(sum(r['page_bytes'] for r in turn_records) / len(turn_records)),
+            'cookie_bytes': max(r['cookie_bytes'] for r in turn_records),
+        })
+
+    return {
+        'concurrency': concurrency,
+        'conversations': len(workload),
+        'requests': len(records),
+        'succeeded': len(ok),
+        'errors': errors,
+        'elapsed_s': round(elapsed, 2),
+        'requests_per_s': round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': distribution([record['latency'] for record in ok]),
+        'ttft_ms': distribution([record['ttft'] for record in ok if record['ttft'] is not None]),
+        'worker_rss': sampler.result(),
+        'by_turn': by_turn,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(url, process, timeout=30):
+    parts = urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {process.returncode} during startup")
+        try:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=2)
+            connection.request('GET', parts.path or '/')
+            connection.getresponse().read()
+            connection.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout}s")
+
+
+def stop(process):
+    if process is not None and process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current):
+    """Print the change in throughput and tail latency against a baseline result file."""
+    levels = {run['concurrency']: run for run in baseline['runs']}
+
+    def change(old, new):
+        if old in (None, 0) or new is None:
+            return 'n/a'
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    print(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    print(f"{'conc':>6} {'req/s':>10} {'p95 ms':>10} {'p99 ms':>10} {'ttft p95':>10}")
+    for run in current['runs']:
+        old = levels.get(run['concurrency'])
+        if old is None:
+            continue
+        latency, old_latency = run['latency_ms'] or {}, old['latency_ms'] or {}
+        ttft, old_ttft = run['ttft_ms'] or {}, old['ttft_ms'] or {}
+        print(f"{run['concurrency']:>6} {change(old['requests_per_s'], run['requests_per_s']):>10} "
+              f"{change(old_latency.get('p95'), latency.get('p95')):>10} "
+              f"{change(old_latency.get('p99'), latency.get('p99')):>10} "
+              f"{change(old_ttft.get('p95'), ttft.get('p95')):>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the chat app against a local mock LLM server.")
+    parser.add_argument('--concurrency', default='1,8,32', help="comma-separated concurrency levels")
+    parser.add_argument('--conversations', type=int, default=32, help="conversations per level")
+    parser.add_argument('--turns', type=int, default=6, help="user turns per conversation")
+    parser.add_argument('--workload', default=os.path.join(ROOT, 'requests.jsonl'),
+                        help="requests.jsonl-style file the conversations are seeded from")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--provider', choices=('openai', 'gemini'), default='openai',
+                        help="which API the mock server is called through")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument('--app-url', help="benchmark an already running app instead of starting one")
+    parser.add_argument('--app-env', action='append', default=[], metavar='KEY=VALUE',
+                        help="extra environment for the app (repeatable)")
+    parser.add_argument('--mock-latency', type=float, default=0.3)
+    parser.add_argument('--mock-jitter', type=float, default=0.1)
+    parser.add_argument('--mock-tokens-per-second', type=float, default=100)
+    parser.add_argument('--mock-response-tokens', type=int, default=120)
+    parser.add_argument('--mock-error-rate', type=float, default=0.0)
+    parser.add_argument('--mock-drop-rate', type=float, default=0.0)
+    parser.add_argument('--output', help="result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument('--compare', metavar='BASELINE', help="result file to compare against")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.workload):
+        parser.error(f"workload file not found: {args.workload} (pass --workload)")
+    levels = [int(level) for level in args.concurrency.split(',')]
+    workload = load_workload(args.workload, args.conversations, args.turns, args.seed)
+    mock_settings = {
+        'latency': args.mock_latency, 'jitter': args.mock_jitter,
+        'tokens_per_second': args.mock_tokens_per_second, 'response_tokens': args.mock_response_tokens,
+        'error_rate': args.mock_error_rate, 'drop_rate': args.mock_drop_rate,
+    }
+
+    mock = app = None
+    scratch = tempfile.mkdtemp(prefix='chat-bench-')
+    try:
+        base_url = args.app_url
+        pids = []
+        if base_url is None:
+            mock_port = free_port()
+            mock = subprocess.Popen([
+                sys.executable, os.path.join(ROOT, 'benchmarks', 'mock_llm_server.py'),
+                '--port', str(mock_port), '--seed', str(args.seed),
+                '--latency', str(args.mock_latency), '--jitter', str(args.mock_jitter),
+                '--tokens-per-second', str(args.mock_tokens_per_second),
+                '--response-tokens', str(args.mock_response_tokens),
+                '--error-rate', str(args.mock_error_rate), '--drop-rate', str(args.mock_drop_rate),
+            ], stdout=subprocess.DEVNULL)
+            mock_url = f'http://127.0.0.1:{mock_port}'
+            wait_until_ready(mock_url + '/health', mock)
+
+            app_port = free_port()
+            # A fresh database per run, so history from earlier runs doesn't skew the results
+            database = os.path.join(scratch, 'bench.db')
+            env = dict(os.environ,
+                       PORT=str(app_port), WEB_CONCURRENCY=str(args.workers), LOG_LEVEL='warning',
+                       LLM_PROVIDER=args.provider, LLM_PROVIDERS='',
+                       OPENAI_BASE_URL=mock_url + '/v1', OPENAI_API_KEY='mock',
+                       GEMINI_BASE_URL=mock_url, GOOGLE_API_KEY='mock',
+                       DATABASE_URL=f'sqlite:///{database}',
+                       # Measure the app, not the per-client limits
+                       SESSION_RATE_PER_MIN='0', IP_RATE_PER_MIN='0')
+            for item in args.app_env:
+                key, _, value = item.partition('=')
+                env[key] = value
+            app = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', 'main:app'], cwd=ROOT, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            base_url = f'http://127.0.0.1:{app_port}'
+            wait_until_ready(base_url + '/metrics', app)
+            pids = worker_pids(app.pid)
+
+        runs = []
+        for level in levels:
+            print(f"Concurrency {level}: {args.conversations} conversations x {args.turns} turns...", flush=True)
+            run = run_level(base_url, workload, level, pids)
+            runs.append(run)
+            latency = run['latency_ms'] or {}
+            ttft = run['ttft_ms'] or {}
+            print(f"  {run['requests_per_s']} req/s, latency p50/p95/p99 "
+                  f"{latency.get('p50')}/{latency.get('p95')}/{latency.get('p99')} ms, "
+                  f"ttft p95 {ttft.get('p95')} ms, errors {run['errors'] or 0}", flush=True)
+    finally:
+        stop(app)
+        stop(mock)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    result = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'app_url': args.app_url,
+            'provider': args.provider,
+            'workers': None if args.app_url else args.workers,
+            'conversations': args.conversations,
+            'turns': args.turns,
+            'seed': args.seed,
+            'app_env': args.app_env,
+            'mock': None if args.app_url else mock_settings,
+        },
+        'runs': runs,
+    }
+
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'results', datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Gunicorn configuration for production serving.
+
+Each worker runs gevent, so a request waiting on the LLM only holds a cheap
+greenlet instead of an OS thread, and a single worker can keep hundreds of
+generations in flight. Run with:
+
+    gunicorn -c gunicorn.conf.py main:app
+"""
+import os
+import sys
+import glob
+import math
+import tempfile
+import subprocess
+import multiprocessing
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Number of worker processes (gunicorn's conventional WEB_CONCURRENCY variable)
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+# gevent by default; set GUNICORN_WORKER_CLASS=gthread (with GUNICORN_THREADS) if gevent is unavailable
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+threads = int(os.environ.get('GUNICORN_THREADS', '1'))
+
+# Maximum simultaneous connections (in-flight requests) per gevent worker
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', '1000'))
+
+# Silent-worker timeout. Async workers heartbeat independently of requests,
+# so this does not cut off long generations.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+
+
+def worst_case_generation_seconds():
+    """
+    Longest a generation can take with the current LLM settings.
+
+    Each provider call may time out after LLM_TIMEOUT and be retried
+    LLM_MAX_RETRIES times with up to 0.5 * 2**attempt seconds of backoff;
+    a failing provider fails over to the next one in LLM_PROVIDERS; and the
+    reply can be preceded by a summarization call with the same budget. A
+    request may also have waited GENERATION_QUEUE_TIMEOUT for a slot.
+    """
+    llm_timeout = float(os.environ.get('LLM_TIMEOUT', '60'))
+    retries = int(os.environ.get('LLM_MAX_RETRIES', '2'))
+    providers = len([name for name in os.environ.get('LLM_PROVIDERS', '').split(',') if name.strip()]) or 1
+    per_provider = llm_timeout * (1 + retries) + sum(0.5 * 2 ** attempt for attempt in range(retries))
+    queue_timeout = float(os.environ.get('GENERATION_QUEUE_TIMEOUT', '10'))
+    return queue_timeout + 2 * providers * per_provider
+
+
+# On SIGTERM workers stop accepting connections and get this long to finish
+# in-flight generations (including streams) before being killed. The default
+# covers the worst case above (373s with the default settings). LLM_TIMEOUT
+# limits the wait between streamed chunks rather than a whole stream, so an
+# unusually long stream can still be cut off.
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', math.ceil(worst_case_generation_seconds())))
+
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+# Don't import the app in the master: gevent must patch the standard library
+# in each worker before the app (and its HTTP/gRPC clients) is imported.
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # Create the conversation schema once, in a separate process so the master
+    # never imports the app; workers then skip create_all() instead of racing
+    subprocess.run([sys.executable, '-m', 'utils.conversation_store'],
+                   cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    os.environ['CONVERSATION_SCHEMA_READY'] = '1'
+
+    # Workers publish metric snapshots here so /metrics adds up every worker,
+    # not just the one that answers the scrape. Inherited by the forked workers.
+    directory = os.environ.get('METRICS_DIR')
+    if not directory:
+        os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix='chat-metrics-')
+        return
+    # Counts from a previous run of the server would otherwise be added in
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+
+def post_fork(server, worker):
+    # grpc (used by google-generativeai) needs explicit gevent integration
+    if worker_class == 'gevent':
+        try:
+            from grpc.experimental import gevent as grpc_gevent
+            grpc_gevent.init_gevent()
+        except ImportError:
+            pass
+
@@ -17,6 +17,13 @@ document.addEventListener('DOMContentLoaded', function() {
     let activeConversationId = null;
     let conversations = {};
 
+    // Abort controller for the response currently being streamed
+    let activeStream = null;
+
+    // Cursor for lazily loading older messages of the active conversation
+    let historyCursor = null;
+    let loadingHistory = false;
+
     // Configure marked.js with highlight.js for code highlighting
     marked.setOptions({
         highlight: function(code, language) {
@@ -31,7 +38,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Initialize the chat interface
     function initChat() {
-        // Load conversations from server (they are stored in the session)
+        // Load conversations from the server-side store
         fetchConversations();
         
         // Set up event listeners
@@ -40,6 +47,13 @@ document.addEventListener('DOMContentLoaded', function() {
         clearChatBtn.addEventListener('click', clearCurrentConversation);
         toggleSidebarBtn.addEventListener('click', toggleSidebar);
         
+        // Load older messages when scrolling near the top
+        chatMessages.addEventListener('scroll', function() {
+            if (this.scrollTop < 200) {
+                loadOlderMessages();
+            }
+        });
+        
         // Make textarea grow with content
         messageInput.addEventListener('input', function() {
             this.style.height = 'auto';
@@ -51,11 +65,22 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    // Fetch conversations from session
-    function fetchConversations() {
-        // Since our conversations are stored in the Flask session, 
-        // we just use the data passed to the template initially
-        // If needed, we could add an API endpoint to refresh this data
+    // Fetch conversation titles from the server-side store
+    async function fetchConversations() {
+        try {
+            const response = await fetch('/api/conversations');
+            const data = await response.json();
+            
+            if (response.ok) {
+                conversations = {};
+                data.forEach(item => {
+                    conversations[item.id] = { title: item.title };
+                });
+            }
+        } catch (error) {
+            console.error('Error:', error);
+        }
+        
         renderConversations();
         
         // Start with the first conversation or create one if none exist
@@ -84,43 +109,78 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Show loading indicator
         loadingIndicator.classList.remove('d-none');
+        sendButton.disabled = true;
+        
+        const conversationId = activeConversationId;
+        const controller = new AbortController();
+        activeStream = controller;
+        let renderer = null;
         
         try {
-            // Send message to server
-            const response = await fetch('/api/send_message', {
+            // Send message to server and stream the response back
+            const response = await fetchWithRetry('/api/send_message_stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
                 body: JSON.stringify({
                     message: message,
-                    conversation_id: activeConversationId
+                    conversation_id: conversationId
                 }),
+                signal: controller.signal,
             });
             
-            const data = await response.json();
-            
-            if (response.ok) {
-                // Add AI response to UI
-                addMessageToUI('assistant', data.response);
-                
-                // Update conversation data
-                conversations[activeConversationId] = data.conversation;
-                
-                // Update the conversation title if it's a new conversation
-                if (data.conversation.title !== 'New conversation') {
-                    conversationTitle.textContent = data.conversation.title;
-                    // Also update in the sidebar
-                    renderConversations();
-                }
-            } else {
+            if (!response.ok) {
                 // Handle errors
+                const data = await response.json();
                 addErrorMessage(data.error || 'An error occurred while processing your request.');
+                return;
             }
+            
+            await readEvents(response, (event) => {
+                if (event.type === 'delta') {
+                    if (!renderer) {
+                        // First token: swap the spinner for the message being written
+                        loadingIndicator.classList.add('d-none');
+                        renderer = createStreamingMessage();
+                    }
+                    renderer.append(event.text);
+                } else if (event.type === 'done') {
+                    if (!renderer) {
+                        renderer = createStreamingMessage();
+                    }
+                    renderer.finish(event.response, event.html);
+                    
+                    // Update the conversation title if it's a new conversation
+                    conversations[conversationId] = { title: event.title };
+                    if (event.title !== 'New conversation') {
+                        conversationTitle.textContent = event.title;
+                        // Also update in the sidebar
+                        renderConversations();
+                    }
+                } else if (event.type === 'error') {
+                    // Failed replies aren't saved, so don't leave a partial one on screen
+                    if (renderer) {
+                        renderer.discard();
+                        renderer = null;
+                    }
+                    addErrorMessage(event.error || 'An error occurred while processing your request.');
+                }
+            });
         } catch (error) {
-            addErrorMessage('Network error. Please try again.');
-            console.error('Error:', error);
+            if (renderer) {
+                renderer.finish();
+            }
+            if (error.name !== 'AbortError') {
+                addErrorMessage('Network error. Please try again.');
+                console.error('Error:', error);
+            }
         } finally {
+            if (activeStream === controller) {
+                activeStream = null;
+            }
+            sendButton.disabled = false;
+            
             // Hide loading indicator
             loadingIndicator.classList.add('d-none');
             
@@ -129,8 +189,207 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Fetch that honors 429/503 responses by waiting for Retry-After and trying again
+    async function fetchWithRetry(url, options, maxRetries = 3) {
+        for (let attempt = 0; ; attempt++) {
+            const response = await fetch(url, options);
+            if ((response.status !== 429 && response.status !== 503) || attempt >= maxRetries) {
+                return response;
+            }
+            
+            const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 2;
+            const notice = addNotice(response.status === 429 ?
+                `You're sending messages too quickly. Retrying in ${retryAfter}s...` :
+                `The assistant is busy. Retrying in ${retryAfter}s...`);
+            
+            try {
+                await new Promise((resolve, reject) => {
+                    const timer = setTimeout(resolve, retryAfter * 1000);
+                    if (options.signal) {
+                        options.signal.addEventListener('abort', () => {
+                            clearTimeout(timer);
+                            reject(new DOMException('Aborted', 'AbortError'));
+                        }, { once: true });
+                    }
+                });
+            } finally {
+                notice.remove();
+            }
+        }
+    }
+
+    // Read a newline-delimited JSON response, calling onEvent for each line
+    async function readEvents(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            let newline;
+            while ((newline = buffer.indexOf('\n')) !== -1) {
+                const line = buffer.slice(0, newline).trim();
+                buffer = buffer.slice(newline + 1);
+                if (line) {
+                    onEvent(JSON.parse(line));
+                }
+            }
+        }
+        
+        if (buffer.trim()) {
+            onEvent(JSON.parse(buffer));
+        }
+    }
+
+    // Stop streaming into the current conversation (e.g. when switching away)
+    function cancelActiveStream() {
+        if (activeStream) {
+            activeStream.abort();
+            activeStream = null;
+        }
+    }
+
+    // Create an assistant message that renders markdown incrementally.
+    // Completed blocks (paragraphs separated by blank lines, closed code fences)
+    // are parsed and highlighted exactly once; only the unfinished tail block is
+    // re-rendered, at most once per animation frame.
+    function createStreamingMessage() {
+        const messageDiv = document.createElement('div');
+        messageDiv.className = 'message assistant-message';
+        
+        const avatar = document.createElement('div');
+        avatar.className = 'message-avatar assistant-avatar';
+        avatar.innerHTML = '<i class="fas fa-robot"></i>';
+        
+        const messageContent = document.createElement('div');
+        messageContent.className = 'message-content';
+        
+        const blocksEl = document.createElement('div');
+        const tailEl = document.createElement('div');
+        messageContent.appendChild(blocksEl);
+        messageContent.appendChild(tailEl);
+        
+        messageDiv.appendChild(avatar);
+        messageDiv.appendChild(messageContent);
+        chatMessages.appendChild(messageDiv);
+        
+        let fullText = '';
+        let pending = '';
+        let scanned = 0;
+        let inFence = false;
+        let frame = null;
+        
+        function renderBlock(markdown) {
+            const block = document.createElement('div');
+            block.innerHTML = marked.parse(markdown);
+            block.querySelectorAll('pre code').forEach((codeBlock) => {
+                hljs.highlightElement(codeBlock);
+            });
+            blocksEl.appendChild(block);
+        }
+        
+        function commit(upTo) {
+            const markdown = pending.slice(0, upTo);
+            pending = pending.slice(upTo);
+            scanned = 0;
+            if (markdown.trim()) {
+                renderBlock(markdown);
+            }
+        }
+        
+        // Look at newly completed lines and commit any finished blocks
+        function scan() {
+            let newline;
+            while ((newline = pending.indexOf('\n', scanned)) !== -1) {
+                const line = pending.slice(scanned, newline);
+                scanned = newline + 1;
+                
+                if (/^\s*(```|~~~)/.test(line)) {
+                    inFence = !inFence;
+                    if (!inFence) {
+                        commit(scanned);
+                    }
+                } else if (!inFence && line.trim() === '' && pending.slice(0, scanned).trim()) {
+                    commit(scanned);
+                }
+            }
+        }
+        
+        function renderTail() {
+            frame = null;
+            tailEl.innerHTML = pending ? marked.parse(pending) : '';
+            scrollToBottom();
+        }
+        
+        return {
+            discard() {
+                if (frame !== null) {
+                    cancelAnimationFrame(frame);
+                    frame = null;
+                }
+                messageDiv.remove();
+            },
+            append(text) {
+                fullText += text;
+                pending += text;
+                scan();
+                if (frame === null) {
+                    frame = requestAnimationFrame(renderTail);
+                }
+            },
+            finish(finalText, html) {
+                if (frame !== null) {
+                    cancelAnimationFrame(frame);
+                    frame = null;
+                }
+                
+                tailEl.remove();
+                if (html) {
+                    // Swap in the server's sanitized rendering, the same markup later page loads get
+                    blocksEl.innerHTML = html;
+                    fullText = finalText;
+                } else {
+                    // The server's copy is authoritative if any chunks were missed
+                    if (finalText !== undefined && finalText !== fullText) {
+                        blocksEl.innerHTML = '';
+                        fullText = finalText;
+                        pending = finalText;
+                    }
+                    commit(pending.length);
+                }
+                
+                // Add copy button for assistant messages
+                const actionsDiv = document.createElement('div');
+                actionsDiv.className = 'message-actions';
+                
+                const copyBtn = document.createElement('button');
+                copyBtn.className = 'btn btn-sm btn-outline-secondary';
+                copyBtn.innerHTML = '<i class="fas fa-copy"></i>';
+                copyBtn.addEventListener('click', () => copyToClipboard(fullText));
+                copyBtn.title = 'Copy response';
+                
+                actionsDiv.appendChild(copyBtn);
+                messageContent.appendChild(actionsDiv);
+                
+                scrollToBottom();
+            }
+        };
+    }
+
     // Add a message to the UI
     function addMessageToUI(role, content) {
+        chatMessages.appendChild(createMessageElement(role, content));
+        
+        // Scroll to bottom
+        scrollToBottom();
+    }
+
+    // Build the element for a message. html is the server's rendering of an
+    // assistant message; without it the markdown is rendered here.
+    function createMessageElement(role, content, html) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${role}-message`;
         
@@ -147,7 +406,7 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Parse markdown in assistant messages
         if (role === 'assistant') {
-            messageContent.innerHTML = marked.parse(content);
+            messageContent.innerHTML = html || marked.parse(content);
             
             // Add copy button for assistant messages
             const actionsDiv = document.createElement('div');
@@ -171,18 +430,65 @@ document.addEventListener('DOMContentLoaded', function() {
         messageDiv.appendChild(avatar);
         messageDiv.appendChild(messageContent);
         
-        // Add to chat
-        chatMessages.appendChild(messageDiv);
-        
-        // Apply syntax highlighting to code blocks
-        if (role === 'assistant') {
+        // Apply syntax highlighting to code blocks (server HTML is already highlighted)
+        if (role === 'assistant' && !html) {
             messageContent.querySelectorAll('pre code').forEach((block) => {
                 hljs.highlightElement(block);
             });
         }
         
-        // Scroll to bottom
+        return messageDiv;
+    }
+
+    // Replace the chat with the newest page of a conversation.
+    // Returns false if the conversation has no messages.
+    function showConversationPage(conversation) {
+        chatMessages.innerHTML = '';
+        historyCursor = conversation.has_more ? conversation.next_cursor : null;
+        
+        if (conversation.messages.length === 0) {
+            return false;
+        }
+        
+        const fragment = document.createDocumentFragment();
+        conversation.messages.forEach(message => {
+            fragment.appendChild(createMessageElement(message.role, message.content, message.html));
+        });
+        chatMessages.appendChild(fragment);
         scrollToBottom();
+        return true;
+    }
+
+    // Prepend the previous page of messages, keeping the scroll position
+    async function loadOlderMessages() {
+        if (!historyCursor || loadingHistory) return;
+        
+        const conversationId = activeConversationId;
+        loadingHistory = true;
+        
+        try {
+            const response = await fetch(
+                `/api/conversations/${encodeURIComponent(conversationId)}/messages?before=${historyCursor}`);
+            const data = await response.json();
+            
+            // Ignore the page if the user switched conversations meanwhile
+            if (!response.ok || conversationId !== activeConversationId) return;
+            
+            const fragment = document.createDocumentFragment();
+            data.messages.forEach(message => {
+                fragment.appendChild(createMessageElement(message.role, message.content, message.html));
+            });
+            
+            const previousHeight = chatMessages.scrollHeight;
+            chatMessages.insertBefore(fragment, chatMessages.firstChild);
+            chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+            
+            historyCursor = data.has_more ? data.next_cursor : null;
+        } catch (error) {
+            console.error('Error:', error);
+        } finally {
+            loadingHistory = false;
+        }
     }
 
     // Add an error message
@@ -193,6 +499,16 @@ document.addEventListener('DOMContentLoaded', function() {
         chatMessages.appendChild(errorDiv);
     }
 
+    // Add a temporary informational notice
+    function addNotice(message) {
+        const noticeDiv = document.createElement('div');
+        noticeDiv.className = 'alert alert-warning m-3';
+        noticeDiv.textContent = message;
+        chatMessages.appendChild(noticeDiv);
+        scrollToBottom();
+        return noticeDiv;
+    }
+
     // Create a new conversation
     async function createNewConversation() {
         try {
@@ -249,6 +565,7 @@ document.addEventListener('DOMContentLoaded', function() {
             if (response.ok) {
                 // Update conversation data
                 conversations[activeConversationId] = data.conversation;
+                historyCursor = null;
                 
                 // Clear the UI
                 chatMessages.innerHTML = `
@@ -287,18 +604,26 @@ document.addEventListener('DOMContentLoaded', function() {
     async function switchConversation(conversationId) {
         if (!conversationId || activeConversationId === conversationId) return;
         
+        // The server keeps whatever was streamed so far
+        cancelActiveStream();
+        
         try {
             loadingIndicator.classList.remove('d-none');
             
-            const response = await fetch('/api/switch_conversation', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    conversation_id: conversationId
+            // The page comes from a GET so the browser can revalidate its cached
+            // copy with If-None-Match; marking the conversation active is a separate call
+            const [response] = await Promise.all([
+                fetch(`/api/conversations/${encodeURIComponent(conversationId)}`),
+                fetch('/api/switch_conversation', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    },
+                    body: JSON.stringify({
+                        conversation_id: conversationId
+                    }),
                 }),
-            });
+            ]);
             
             const data = await response.json();
             
@@ -307,20 +632,13 @@ document.addEventListener('DOMContentLoaded', function() {
                 activeConversationId = conversationId;
                 
                 // Update conversation data
-                conversations[conversationId] = data.conversation;
+                conversations[conversationId] = data;
                 
                 // Update UI
-                conversationTitle.textContent = data.conversation.title;
+                conversationTitle.textContent = data.title;
                 
-                // Clear current messages
-                chatMessages.innerHTML = '';
-                
-                // Load conversation messages
-                if (data.conversation.messages.length > 0) {
-                    data.conversation.messages.forEach(message => {
-                        addMessageToUI(message.role, message.content);
-                    });
-                } else {
+                // Load the newest messages; older ones load on scroll
+                if (!showConversationPage(data)) {
                     // Show welcome message if conversation is empty
                     chatMessages.innerHTML = `
                         <div class="welcome-message text-center my-5">
@@ -378,18 +696,12 @@ document.addEventListener('DOMContentLoaded', function() {
                 activeConversationId = data.active_conversation;
                 
                 // Update UI for the active conversation
-                if (conversations[activeConversationId]) {
-                    conversationTitle.textContent = conversations[activeConversationId].title;
-                    
-                    // Clear current messages
-                    chatMessages.innerHTML = '';
+                if (data.conversation) {
+                    conversations[activeConversationId] = data.conversation;
+                    conversationTitle.textContent = data.conversation.title;
                     
-                    // Load conversation messages
-                    if (conversations[activeConversationId].messages.length > 0) {
-                        conversations[activeConversationId].messages.forEach(message => {
-                            addMessageToUI(message.role, message.content);
-                        });
-                    } else {
+                    // Load the newest messages; older ones load on scroll
+                    if (!showConversationPage(data.conversation)) {
                         // Show welcome message if conversation is empty
                         chatMessages.innerHTML = `
                             <div class="welcome-message text-center my-5">
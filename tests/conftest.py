@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+# app.py reads its configuration at import time: run it offline, in memory, without rate limits
+os.environ.update({
+    'LLM_PROVIDER': 'fake',
+    'CONVERSATION_STORE': 'memory',
+    'SESSION_RATE_PER_MIN': '0',
+    'IP_RATE_PER_MIN': '0',
+    'MESSAGE_PAGE_SIZE': '4',
+})
+os.environ.pop('LLM_PROVIDERS', None)
+os.environ.pop('RESPONSE_CACHE', None)
+os.environ.pop('BATCH_API_TOKEN', None)
+os.environ.pop('METRICS_DIR', None)
+
+
+@pytest.fixture
+def messages():
+    return [{'role': 'user', 'content': 'hello'}]
+
+
+@pytest.fixture
+def client():
+    """Test client for the app, with a fresh session (and so a fresh owner)."""
+    from app import app
+    return app.test_client()
+
+
+@pytest.fixture
+def conversation_id(client):
+    client.get('/')
+    return client.get('/api/conversations').get_json()[0]['id']
+
@@ -0,0 +1,127 @@
+import json
+
+
+def send(client, conversation_id, message):
+    response = client.post('/api/send_message', json={'message': message, 'conversation_id': conversation_id})
+    assert response.status_code == 200
+    # The request is logged and counted when the response is closed
+    response.close()
+    return response.get_json()
+
+
+def test_empty_message_is_rejected(client, conversation_id):
+    response = client.post('/api/send_message', json={'message': '  ', 'conversation_id': conversation_id})
+    assert response.status_code == 400
+
+
+def test_other_sessions_cannot_read_conversation(client, conversation_id):
+    from app import app
+
+    other = app.test_client()
+    assert other.get(f'/api/conversations/{conversation_id}').status_code == 404
+    assert other.post('/api/send_message',
+                      json={'message': 'hi', 'conversation_id': conversation_id}).status_code == 400
+
+
+def test_stream_sends_events_and_persists_reply(client, conversation_id):
+    response = client.post('/api/send_message_stream',
+                           json={'message': 'stream please', 'conversation_id': conversation_id})
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert events[0]['type'] == 'start'
+    assert events[-1]['type'] == 'done'
+    deltas = ''.join(event['text'] for event in events if event['type'] == 'delta')
+    assert deltas == events[-1]['response']
+
+    page = client.get(f'/api/conversations/{conversation_id}').get_json()
+    assert page['messages'][-1]['content'] == deltas
+
+
+def test_disconnect_after_done_stores_reply_once(client, conversation_id):
+    response = client.post('/api/send_message_stream', buffered=False,
+                           json={'message': 'stream please', 'conversation_id': conversation_id})
+    for line in response.response:
+        if json.loads(line)['type'] == 'done':
+            break
+    # The client goes away before the generator finishes
+    response.close()
+
+    page = client.get(f'/api/conversations/{conversation_id}').get_json()
+    assert [msg['role'] for msg in page['messages']] == ['user', 'assistant']
+
+
+def test_metrics_endpoint(client, conversation_id):
+    send(client, conversation_id, 'count me')
+    body = client.get('/metrics').get_data(as_text=True)
+
+    assert 'chat_http_requests_total{endpoint="send_message",status="200"}' in body
+    assert 'llm_request_seconds_count{provider="fake"}' in body
+
+
+def test_send_message_returns_only_new_messages(client, conversation_id):
+    data = send(client, conversation_id, 'first question')
+    assert [msg['role'] for msg in data['messages']] == ['user', 'assistant']
+    assert data['conversation']['title'] == 'first question'
+    assert 'html' in data['messages'][1]
+
+    data = send(client, conversation_id, 'second question')
+    assert [msg['content'] for msg in data['messages']][0] == 'second question'
+    assert len(data['messages']) == 2
+
+
+def test_history_pages_follow_cursor(client, conversation_id):
+    # MESSAGE_PAGE_SIZE is 4 in the tests
+    for index in range(3):
+        send(client, conversation_id, f"question {index}")
+
+    page = client.get(f'/api/conversations/{conversation_id}').get_json()
+    assert len(page['messages']) == 4
+    assert page['has_more']
+    assert page['messages'][0]['content'] == 'question 1'
+
+    older = client.get(f"/api/conversations/{conversation_id}/messages?before={page['next_cursor']}").get_json()
+    assert [msg['content'] for msg in older['messages']][0] == 'question 0'
+    assert len(older['messages']) == 2
+    assert not older['has_more']
+    assert older['next_cursor'] is None
+
+
+def test_invalid_page_requests(client, conversation_id):
+    assert client.get(f'/api/conversations/{conversation_id}/messages?limit=0').status_code == 400
+    assert client.get('/api/conversations/missing').status_code == 404
+
+
+def test_unchanged_conversation_is_not_modified(client, conversation_id):
+    url = f'/api/conversations/{conversation_id}'
+    first = client.get(url)
+    etag = first.headers['ETag']
+
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    send(client, conversation_id, 'something new')
+    changed = client.get(url, headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_message_page_etag_depends_on_cursor(client, conversation_id):
+    for index in range(3):
+        send(client, conversation_id, f"question {index}")
+    base = f'/api/conversations/{conversation_id}/messages'
+    newest = client.get(base)
+    older = client.get(f"{base}?before={newest.get_json()['next_cursor']}")
+
+    assert newest.headers['ETag'] != older.headers['ETag']
+    assert client.get(base, headers={'If-None-Match': newest.headers['ETag']}).status_code == 304
+
+
+def test_switch_conversation_only_sets_active(client, conversation_id):
+    created = client.post('/api/create_conversation').get_json()
+    assert created['conversation']['messages'] == []
+
+    response = client.post('/api/switch_conversation', json={'conversation_id': conversation_id})
+    assert response.get_json() == {'status': 'success'}
+    with client.session_transaction() as session:
+        assert session['active_conversation'] == conversation_id
+
+    assert client.post('/api/switch_conversation', json={'conversation_id': 'missing'}).status_code == 400
@@ -0,0 +1,96 @@
+import json
+import time
+
+import pytest
+
+from utils.batch import BatchJobs, BatchRunner, completed_ids, parse_item
+from utils.providers import FakeProvider
+
+
+class CountingProvider(FakeProvider):
+    """Fake provider that records the prompts it was called with."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.prompts = []
+
+    def _generate(self, messages, system_prompt):
+        self.prompts.append(messages[-1]['content'])
+        return super()._generate(messages, system_prompt)
+
+
+def write_jsonl(path, records):
+    path.write_text(''.join(json.dumps(record) + '\n' for record in records), encoding='utf-8')
+
+
+def wait_for_state(jobs, job_id, states, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = jobs.status(job_id)
+        if status['state'] in states:
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f"job stayed {jobs.status(job_id)['state']}")
+
+
+def test_parse_item_shapes():
+    assert parse_item({'id': 'a', 'prompt': 'hi'}, 1)['messages'] == [{'role': 'user', 'content': 'hi'}]
+    request = parse_item({'request_id': 'r-1', 'title': 'Title', 'body': 'Body'}, 2)
+    assert request == {'id': 'r-1', 'messages': [{'role': 'user', 'content': 'Title\n\nBody'}]}
+    assert parse_item({'messages': [{'role': 'user', 'content': 'x'}]}, 3)['id'] == 'line-3'
+
+    with pytest.raises(ValueError):
+        parse_item({'messages': [{'role': 'assistant', 'content': 'x'}]}, 4)
+
+
+def test_completed_ids_ignores_failures_and_torn_lines(tmp_path):
+    output = tmp_path / 'out.jsonl'
+    output.write_text(json.dumps({'id': 'a', 'error': None}) + '\n'
+                      + json.dumps({'id': 'b', 'error': 'boom'}) + '\n'
+                      + '{"id": "c", "err', encoding='utf-8')
+
+    assert completed_ids(str(output)) == {'a'}
+
+
+def test_resume_skips_finished_items(tmp_path):
+    source = tmp_path / 'in.jsonl'
+    output = tmp_path / 'out.jsonl'
+    write_jsonl(source, [{'id': item_id, 'prompt': item_id} for item_id in ('a', 'b', 'c')])
+    write_jsonl(output, [{'id': 'a', 'response': 'done', 'error': None},
+                         {'id': 'b', 'response': None, 'error': 'boom'}])
+    provider = CountingProvider()
+
+    stats = BatchRunner(provider, workers=2).run(str(source), str(output))
+
+    assert sorted(provider.prompts) == ['b', 'c']
+    assert (stats['processed'], stats['succeeded'], stats['skipped']) == (2, 2, 1)
+    assert completed_ids(str(output)) == {'a', 'b', 'c'}
+
+
+def test_job_runs_in_one_process_at_a_time(tmp_path):
+    # Two managers on one directory stand in for two worker processes
+    first = BatchJobs(FakeProvider(latency=0.3), str(tmp_path))
+    second = BatchJobs(FakeProvider(), str(tmp_path))
+    job_id = first.create([json.dumps({'prompt': f"p{index}"}) for index in range(2)])
+
+    assert wait_for_state(second, job_id, ('running',))['state'] == 'running'
+    assert not second.start(job_id)
+
+    status = wait_for_state(second, job_id, ('completed',))
+    assert status['succeeded'] == 2
+    with open(first.output_path(job_id), encoding='utf-8') as f:
+        assert len(f.readlines()) == 2
+
+
+def test_orphaned_job_is_interrupted_and_resumable(tmp_path):
+    jobs = BatchJobs(FakeProvider(), str(tmp_path))
+    job_id = jobs.create([json.dumps({'prompt': 'p'})])
+    wait_for_state(jobs, job_id, ('completed',))
+
+    # As left behind by a worker that was killed mid-run
+    jobs._write_status(job_id, state='running')
+    assert jobs.status(job_id)['state'] == 'interrupted'
+
+    assert jobs.start(job_id)
+    status = wait_for_state(jobs, job_id, ('completed',))
+    assert status['skipped'] == 1
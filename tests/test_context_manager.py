@@ -0,0 +1,87 @@
+import pytest
+
+from utils.context_manager import SUMMARY_PREFIX, ContextManager
+from utils.conversation_store import MemoryConversationStore
+
+
+@pytest.fixture
+def store():
+    return MemoryConversationStore()
+
+
+def make_conversation(store, count, length=60):
+    conversation_id = store.create_conversation('owner')
+    for index in range(count):
+        store.append_message('owner', conversation_id, 'user' if index % 2 == 0 else 'assistant',
+                             f"{index} " + 'x' * length)
+    return conversation_id
+
+
+def build(manager, store, conversation_id):
+    return manager.build('owner', store.get_conversation('owner', conversation_id, unsummarized_only=True))
+
+
+def test_short_conversation_is_sent_verbatim(store):
+    conversation_id = make_conversation(store, 3)
+
+    def summarize(summary, messages):
+        raise AssertionError("nothing should be folded")
+
+    context = build(ContextManager(store, summarize, model='test', budget=1000), store, conversation_id)
+    assert [msg['content'][0] for msg in context] == ['0', '1', '2']
+
+
+def test_overflow_folds_older_messages_into_summary(store):
+    conversation_id = make_conversation(store, 10)
+    folded = []
+
+    def summarize(summary, messages):
+        folded.extend(messages)
+        return 'the summary'
+
+    context = build(ContextManager(store, summarize, model='test', budget=100), store, conversation_id)
+
+    assert context[0] == {'role': 'system', 'content': SUMMARY_PREFIX + 'the summary'}
+    assert context[1]['role'] == 'user'
+    # Everything is either folded or sent, in order
+    sent = [msg['content'] for msg in context[1:]]
+    assert [msg['content'] for msg in folded] + sent == [
+        msg['content'] for msg in store.get_conversation('owner', conversation_id)['messages']]
+    header = store.get_header('owner', conversation_id)
+    assert header['summary'] == 'the summary'
+    assert header['summary_upto'] == folded[-1]['id']
+
+
+def test_failed_summary_keeps_full_budget_window(store):
+    # 20 tokens per message against an 88-token recent budget (44 at the low-water mark)
+    conversation_id = make_conversation(store, 10)
+
+    def summarize(summary, messages):
+        raise RuntimeError("summarizer down")
+
+    manager = ContextManager(store, summarize, model='test', budget=100)
+    context = build(manager, store, conversation_id)
+
+    # No summary, but every message that fits the full budget rather than the low-water window
+    assert [msg['content'][0] for msg in context] == ['6', '7', '8', '9']
+    assert store.get_header('owner', conversation_id)['summary_upto'] == 0
+
+
+def test_summary_extended_only_with_new_messages(store):
+    conversation_id = make_conversation(store, 10)
+    calls = []
+
+    def summarize(summary, messages):
+        calls.append((summary, [msg['id'] for msg in messages]))
+        return f"summary {len(calls)}"
+
+    manager = ContextManager(store, summarize, model='test', budget=100)
+    build(manager, store, conversation_id)
+    for index in range(10, 16):
+        store.append_message('owner', conversation_id, 'user' if index % 2 == 0 else 'assistant',
+                             f"{index} " + 'x' * 60)
+    build(manager, store, conversation_id)
+
+    assert len(calls) == 2
+    assert calls[1][0] == 'summary 1'
+    assert min(calls[1][1]) > max(calls[0][1])
@@ -0,0 +1,112 @@
+import pytest
+from flask import Flask
+
+from utils.conversation_store import DEFAULT_TITLE, MemoryConversationStore, db, init_conversation_store
+
+
+@pytest.fixture
+def sql_app(tmp_path, monkeypatch):
+    monkeypatch.setenv('CONVERSATION_STORE', 'sqlite')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'chat.db'}"
+    store = init_conversation_store(app)
+    with app.app_context():
+        yield app, store
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request):
+    if request.param == 'memory':
+        return MemoryConversationStore()
+    return request.getfixturevalue('sql_app')[1]
+
+
+def fill(store, conversation_id, count):
+    return [store.append_message('owner', conversation_id, 'user' if index % 2 == 0 else 'assistant', f"m{index}")
+            for index in range(count)]
+
+
+def test_pages_walk_back_through_history(store):
+    conversation_id = store.create_conversation('owner')
+    appended = fill(store, conversation_id, 7)
+
+    messages, has_more = store.get_messages('owner', conversation_id, limit=3)
+    assert [msg['content'] for msg in messages] == ['m4', 'm5', 'm6']
+    assert has_more
+
+    messages, has_more = store.get_messages('owner', conversation_id, before=messages[0]['id'], limit=3)
+    assert [msg['content'] for msg in messages] == ['m1', 'm2', 'm3']
+    assert has_more
+
+    messages, has_more = store.get_messages('owner', conversation_id, before=messages[0]['id'], limit=3)
+    assert [msg['content'] for msg in messages] == ['m0']
+    assert not has_more
+    assert messages[0]['id'] == appended[0]['id']
+
+
+def test_exact_page_has_no_more(store):
+    conversation_id = store.create_conversation('owner')
+    fill(store, conversation_id, 3)
+
+    messages, has_more = store.get_messages('owner', conversation_id, limit=3)
+    assert len(messages) == 3
+    assert not has_more
+
+
+def test_version_tracks_visible_changes(store):
+    conversation_id = store.create_conversation('owner')
+    versions = [store.get_header('owner', conversation_id)['version']]
+
+    message = store.append_message('owner', conversation_id, 'user', 'hi')
+    versions.append(store.get_header('owner', conversation_id)['version'])
+    store.set_title('owner', conversation_id, 'Greeting')
+    versions.append(store.get_header('owner', conversation_id)['version'])
+    store.set_summary('owner', conversation_id, 'said hi', message['id'])
+    versions.append(store.get_header('owner', conversation_id)['version'])
+    store.clear_conversation('owner', conversation_id)
+    versions.append(store.get_header('owner', conversation_id)['version'])
+
+    assert versions[0] < versions[1] < versions[2] == versions[3] < versions[4]
+    assert store.get_header('owner', conversation_id)['title'] == DEFAULT_TITLE
+
+
+def test_unsummarized_only_skips_folded_messages(store):
+    conversation_id = store.create_conversation('owner')
+    appended = fill(store, conversation_id, 4)
+    store.set_summary('owner', conversation_id, 'summary', appended[1]['id'])
+
+    conversation = store.get_conversation('owner', conversation_id, unsummarized_only=True)
+    assert [msg['content'] for msg in conversation['messages']] == ['m2', 'm3']
+    assert conversation['summary_upto'] == appended[1]['id']
+
+
+def test_other_owners_cannot_see_conversation(store):
+    conversation_id = store.create_conversation('owner')
+
+    assert store.get_header('intruder', conversation_id) is None
+    assert store.get_messages('intruder', conversation_id) is None
+    assert store.list_conversations('intruder') == []
+    with pytest.raises(KeyError):
+        store.append_message('intruder', conversation_id, 'user', 'hi')
+
+
+def test_append_message_returns_without_holding_a_connection(sql_app):
+    _, store = sql_app
+    conversation_id = store.create_conversation('owner')
+    store.get_conversation('owner', conversation_id)
+
+    message = store.append_message('owner', conversation_id, 'user', 'hello')
+
+    assert message['id'] and message['tokens']
+    assert db.engine.pool.checkedout() == 0
+
+
+def test_release_returns_the_connection(sql_app):
+    _, store = sql_app
+    conversation_id = store.create_conversation('owner')
+    store.get_header('owner', conversation_id)
+    assert db.engine.pool.checkedout() == 1
+
+    store.release()
+    assert db.engine.pool.checkedout() == 0
+    assert store.get_header('owner', conversation_id)['id'] == conversation_id
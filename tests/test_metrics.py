@@ -0,0 +1,103 @@
+import os
+import json
+
+import pytest
+
+from utils.metrics import Counter, Gauge, Histogram, Registry
+
+
+def dead_pid():
+    """Return a PID with no running process."""
+    pid = 2 ** 22 - 1
+    while True:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return pid
+        except PermissionError:
+            pass
+        pid -= 1
+
+
+def make_registry():
+    registry = Registry()
+    requests = registry.register(Counter('requests_total', 'Requests', ('status',)))
+    seconds = registry.register(Histogram('request_seconds', 'Duration', buckets=(0.1, 1)))
+    in_flight = {'value': 2}
+    registry.register(Gauge('in_flight', 'In flight', lambda: in_flight['value']))
+    registry.register(Gauge('circuit_open', 'Circuit', lambda: {('fake',): 0}, ('provider',), aggregate='max'))
+    return registry, requests, seconds
+
+
+def write_snapshot(directory, pid, metrics):
+    with open(os.path.join(directory, f'{pid}.json'), 'w', encoding='utf-8') as f:
+        json.dump({'pid': pid, 'metrics': metrics}, f)
+
+
+def test_render_without_sharing():
+    registry, requests, seconds = make_registry()
+    requests.inc(status=200)
+    requests.inc(status=200)
+    seconds.observe(0.05)
+    seconds.observe(5)
+
+    lines = registry.render().splitlines()
+    assert 'requests_total{status="200"} 2' in lines
+    assert 'request_seconds_bucket{le="0.1"} 1' in lines
+    assert 'request_seconds_bucket{le="1"} 1' in lines
+    assert 'request_seconds_bucket{le="+Inf"} 2' in lines
+    assert 'in_flight 2' in lines
+
+
+@pytest.fixture
+def shared(tmp_path):
+    registry, requests, seconds = make_registry()
+    registry.share(str(tmp_path), interval=3600)
+    return registry, requests, seconds, str(tmp_path)
+
+
+def test_shared_render_adds_up_workers(shared):
+    registry, requests, seconds, directory = shared
+    requests.inc(status=200)
+    seconds.observe(0.05)
+    # Another worker that is still running
+    write_snapshot(directory, os.getppid(), {
+        'requests_total': [[[200], 3], [[500], 1]],
+        'request_seconds': [[[], {'counts': [0, 2], 'sum': 1.0, 'count': 2}]],
+        'in_flight': [[[], 5]],
+        'circuit_open': [[['fake'], 1]],
+    })
+
+    lines = registry.render().splitlines()
+    assert 'requests_total{status="200"} 4' in lines
+    assert 'requests_total{status="500"} 1' in lines
+    assert 'request_seconds_bucket{le="0.1"} 1' in lines
+    assert 'request_seconds_bucket{le="1"} 3' in lines
+    assert 'request_seconds_count 3' in lines
+    assert 'in_flight 7' in lines
+    assert 'circuit_open{provider="fake"} 1' in lines
+
+
+def test_exited_workers_keep_counts_but_not_gauges(shared):
+    registry, requests, _, directory = shared
+    requests.inc(status=200)
+    write_snapshot(directory, dead_pid(), {
+        'requests_total': [[[200], 10]],
+        'in_flight': [[[], 5]],
+        'circuit_open': [[['fake'], 1]],
+    })
+
+    lines = registry.render().splitlines()
+    assert 'requests_total{status="200"} 11' in lines
+    assert 'in_flight 2' in lines
+    assert 'circuit_open{provider="fake"} 0' in lines
+
+
+def test_shared_render_publishes_own_snapshot(shared):
+    registry, requests, _, directory = shared
+    requests.inc(status=200)
+    registry.render()
+
+    with open(os.path.join(directory, f'{os.getpid()}.json'), encoding='utf-8') as f:
+        snapshot = json.load(f)
+    assert snapshot['metrics']['requests_total'] == [[[200], 1]]
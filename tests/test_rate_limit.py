@@ -0,0 +1,109 @@
+import time
+import threading
+
+import pytest
+
+from utils.rate_limit import AdmissionController, AdmissionRejected, MemoryLimiterBackend
+
+
+def controller(**kwargs):
+    options = {'session_rate': 0, 'ip_rate': 0}
+    options.update(kwargs)
+    return AdmissionController(MemoryLimiterBackend(), **options)
+
+
+def test_session_burst_then_429():
+    admission = controller(session_rate=60, session_burst=2)
+    admission.check_rate('session', 'ip')
+    admission.check_rate('session', 'ip')
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.check_rate('session', 'ip')
+    assert rejected.value.status == 429
+    assert rejected.value.retry_after >= 1
+
+    # Other sessions have their own bucket
+    admission.check_rate('other', 'ip')
+
+
+def test_ip_limit_applies_across_sessions():
+    admission = controller(ip_rate=60, ip_burst=1)
+    admission.check_rate('one', '10.0.0.1')
+
+    with pytest.raises(AdmissionRejected):
+        admission.check_rate('two', '10.0.0.1')
+    admission.check_rate('two', '10.0.0.2')
+
+
+def test_slots_are_limited_and_released():
+    admission = controller(max_concurrent=1, queue_timeout=0.1)
+    slot = admission.acquire()
+    assert admission.in_flight == 1
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire()
+    assert rejected.value.status == 503
+
+    slot.release()
+    slot.release()
+    assert admission.in_flight == 0
+    admission.acquire().release()
+
+
+def test_waiter_gets_slot_when_one_is_released():
+    admission = controller(max_concurrent=1, queue_timeout=5)
+    slot = admission.acquire()
+    acquired = []
+
+    def wait_for_slot():
+        with admission.acquire():
+            acquired.append(time.monotonic())
+
+    thread = threading.Thread(target=wait_for_slot)
+    thread.start()
+    time.sleep(0.1)
+    assert admission.waiting == 1
+
+    released_at = time.monotonic()
+    slot.release()
+    thread.join()
+    assert acquired and acquired[0] - released_at < 1
+    assert admission.waiting == 0
+
+
+def test_full_queue_is_rejected_immediately():
+    admission = controller(max_concurrent=1, max_queue=0, queue_timeout=5)
+    admission.acquire()
+
+    start = time.monotonic()
+    with pytest.raises(AdmissionRejected):
+        admission.acquire()
+    assert time.monotonic() - start < 0.5
+
+
+def test_new_arrivals_queue_behind_waiters():
+    admission = controller(max_concurrent=1, queue_timeout=1)
+    slot = admission.acquire()
+    acquired = []
+
+    thread = threading.Thread(target=lambda: acquired.append(admission.acquire()))
+    thread.start()
+    time.sleep(0.1)
+
+    slot.release()
+    # The freed slot belongs to the request that was already waiting
+    with pytest.raises(AdmissionRejected):
+        admission.acquire()
+    thread.join()
+    assert len(acquired) == 1
+
+
+def test_releasing_unknown_holder_frees_nothing():
+    backend = MemoryLimiterBackend()
+    holder = backend.try_acquire('slots', 1)
+
+    backend.release('slots', 'unknown')
+    backend.release('slots', holder)
+    backend.release('slots', holder)
+    assert backend.try_acquire('slots', 1) is not None
+    assert backend.try_acquire('slots', 1) is None
@@ -0,0 +1,60 @@
+import pytest
+
+from utils.rendering import CODE_CSS_CLASS, MarkdownRenderer
+
+for module in ('markdown', 'nh3', 'pygments'):
+    pytest.importorskip(module)
+
+
+@pytest.fixture
+def renderer():
+    return MarkdownRenderer()
+
+
+def test_script_tags_are_removed(renderer):
+    html = renderer.render('hello <script>alert(1)</script>')
+
+    assert '<script' not in html
+    assert 'hello' in html
+
+
+@pytest.mark.parametrize('content', [
+    '[click](javascript:alert(1))',
+    '<a href="javascript:alert(1)">click</a>',
+    '[click](data:text/html;base64,PHNjcmlwdD5hbGVydCgxKTwvc2NyaXB0Pg==)',
+    '![x](data:image/svg+xml;base64,PHN2Zz48L3N2Zz4=)',
+])
+def test_unsafe_link_schemes_are_removed(renderer, content):
+    html = renderer.render(content)
+
+    assert 'javascript:' not in html
+    assert 'data:' not in html
+
+
+def test_event_handler_attributes_are_removed(renderer):
+    html = renderer.render('<img src="x.png" onerror="alert(1)"> <p onclick="alert(1)">hi</p>')
+
+    assert 'onerror' not in html
+    assert 'onclick' not in html
+    assert 'alert' not in html
+
+
+def test_safe_links_keep_rel(renderer):
+    html = renderer.render('[docs](https://example.com)')
+
+    assert 'href="https://example.com"' in html
+    assert 'noopener' in html
+
+
+def test_code_blocks_keep_highlight_class(renderer):
+    html = renderer.render('```python\nprint("hi")\n```')
+
+    assert f'class="{CODE_CSS_CLASS}"' in html
+    # Tokens are marked with classes; inline styles would be stripped
+    assert '<span class="' in html
+    assert 'style=' not in html
+
+
+def test_rendered_html_is_cached(renderer):
+    assert renderer.render('**bold**') == renderer.render('**bold**')
+    assert renderer.stats()['hits'] == 1
@@ -0,0 +1,173 @@
+import time
+import threading
+
+import pytest
+
+from utils.providers import FakeProvider, ProviderError
+from utils.response_cache import CachedProvider, ResponseCache, make_cache_key
+
+
+class CountingProvider(FakeProvider):
+    """Fake provider that counts upstream calls."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = 0
+
+    def _generate(self, messages, system_prompt):
+        self.calls += 1
+        return super()._generate(messages, system_prompt)
+
+    def _stream(self, messages, system_prompt):
+        self.calls += 1
+        yield from super()._stream(messages, system_prompt)
+
+
+def run_concurrently(count, target):
+    """Start target(index) in count threads, slightly staggered, and wait for them."""
+    threads = [threading.Thread(target=target, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+
+
+def test_key_ignores_insignificant_differences():
+    key = make_cache_key('fake', 'fake-1', 'system', [{'role': 'user', 'content': 'hi'}])
+
+    assert make_cache_key('fake', 'fake-1', 'system', [{'role': 'User', 'content': ' hi\r\n'}]) == key
+    assert make_cache_key('fake', 'fake-1', 'system', [{'role': 'user', 'content': 'hi!'}]) != key
+    assert make_cache_key('fake', 'fake-2', 'system', [{'role': 'user', 'content': 'hi'}]) != key
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2)
+    cache.set('a', '1')
+    cache.set('b', '2')
+    cache.get('a')
+    cache.set('c', '3')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == '1'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_expired_entries_miss():
+    cache = ResponseCache(ttl=0.05)
+    cache.set('a', '1')
+    time.sleep(0.1)
+
+    assert cache.get('a') is None
+
+
+def test_sqlite_tier_survives_restart(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    ResponseCache(db_path=path).set('a', '1')
+
+    assert ResponseCache(db_path=path).get('a') == '1'
+
+
+def test_repeated_requests_are_served_from_cache(messages):
+    upstream = CountingProvider()
+    provider = CachedProvider(upstream, ResponseCache())
+
+    assert provider.generate(messages) == provider.generate(messages)
+    assert ''.join(provider.stream(messages)) == provider.generate(messages)
+    assert upstream.calls == 1
+
+
+def test_concurrent_generations_share_one_call(messages):
+    upstream = CountingProvider(latency=0.2)
+    provider = CachedProvider(upstream, ResponseCache())
+    results = {}
+
+    run_concurrently(3, lambda index: results.update({index: provider.generate(messages)}))
+
+    assert upstream.calls == 1
+    assert len(set(results.values())) == 1
+
+
+def test_coalesced_streams_follow_the_leader(messages):
+    upstream = CountingProvider(latency=0.1, tokens_per_second=50)
+    provider = CachedProvider(upstream, ResponseCache())
+    results = {}
+
+    def stream(index):
+        start = time.monotonic()
+        first_chunk = None
+        chunks = []
+        for text in provider.stream(messages):
+            if first_chunk is None:
+                first_chunk = time.monotonic() - start
+            chunks.append(text)
+        results[index] = (first_chunk, time.monotonic() - start, ''.join(chunks))
+
+    run_concurrently(3, stream)
+
+    assert upstream.calls == 1
+    assert provider.cache.stats()['coalesced'] == 2
+    assert len({text for _, _, text in results.values()}) == 1
+    for first_chunk, total, _ in results.values():
+        # Followers get their first chunk long before the leader's stream ends
+        assert first_chunk < total / 2
+
+
+def test_follower_makes_own_call_when_leader_fails_early(messages):
+    cache = ResponseCache()
+    key = 'key'
+    leader_started = threading.Event()
+
+    def failing_stream():
+        leader_started.set()
+        time.sleep(0.1)
+        raise ProviderError('fake', 'down')
+        yield
+
+    errors = []
+
+    def leader():
+        try:
+            list(cache.stream_or_compute(key, failing_stream))
+        except ProviderError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    leader_started.wait()
+
+    assert ''.join(cache.stream_or_compute(key, lambda: iter(['own ', 'call']))) == 'own call'
+    thread.join()
+    assert len(errors) == 1
+
+
+def test_follower_sees_leader_failure_mid_stream():
+    cache = ResponseCache()
+    first_chunk_sent = threading.Event()
+
+    def failing_stream():
+        yield 'partial '
+        first_chunk_sent.set()
+        time.sleep(0.1)
+        raise ProviderError('fake', 'dropped')
+
+    errors = []
+
+    def leader():
+        try:
+            list(cache.stream_or_compute('key', failing_stream))
+        except ProviderError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    first_chunk_sent.wait()
+
+    chunks = []
+    with pytest.raises(ProviderError, match='dropped'):
+        for text in cache.stream_or_compute('key', lambda: iter(['unused'])):
+            chunks.append(text)
+    thread.join()
+    assert len(errors) == 1
+    assert chunks == ['partial ']
+    assert cache.get('key') is None
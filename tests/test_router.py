@@ -0,0 +1,173 @@
+import json
+import time
+
+import pytest
+from flask import Flask, g
+
+from utils import metrics
+from utils.metrics import InstrumentedProvider
+from utils.providers import FakeProvider, ProviderError
+from utils.router import CircuitBreaker, ProviderRouter
+
+
+class FailingProvider(FakeProvider):
+    """Fake provider whose calls fail immediately, without retries."""
+
+    name = 'failing'
+
+    def __init__(self, **kwargs):
+        super().__init__(max_retries=0, **kwargs)
+        self.calls = 0
+
+    def _generate(self, messages, system_prompt):
+        self.calls += 1
+        raise RuntimeError("upstream unavailable")
+
+    def _stream(self, messages, system_prompt):
+        self.calls += 1
+        raise RuntimeError("upstream unavailable")
+        yield
+
+
+def named(provider, name):
+    provider.name = name
+    return provider
+
+
+def test_fails_over_to_next_provider(messages):
+    bad = FailingProvider()
+    router = ProviderRouter([bad, FakeProvider()], hedge=False)
+
+    assert router.generate(messages) == FakeProvider().generate(messages)
+    assert bad.calls == 1
+
+
+def test_failing_provider_ranked_after_healthy_one(messages):
+    bad = FailingProvider()
+    router = ProviderRouter([bad, FakeProvider()], hedge=False, failure_threshold=2)
+
+    router.generate(messages)
+    assert [route.provider.name for route in router._ranked('generate')] == ['fake', 'failing']
+
+    # The failing provider isn't tried first again, even though its circuit is still closed
+    router.generate(messages)
+    assert bad.calls == 1
+    assert router.routes[0].breaker.state == CircuitBreaker.CLOSED
+
+
+def test_unsampled_providers_keep_configured_order():
+    router = ProviderRouter([named(FakeProvider(), 'first'), named(FakeProvider(), 'second')])
+
+    assert [route.provider.name for route in router._ranked('stream')] == ['first', 'second']
+
+
+def test_stream_fails_over_before_first_chunk(messages):
+    router = ProviderRouter([FailingProvider(), FakeProvider()], hedge=False)
+
+    assert ''.join(router.stream(messages)) == FakeProvider().generate(messages)
+
+
+def test_all_providers_failing_raises(messages):
+    router = ProviderRouter([FailingProvider(), FailingProvider()], hedge=False)
+
+    with pytest.raises(ProviderError):
+        router.generate(messages)
+
+
+def test_open_circuit_is_skipped(messages):
+    bad = FailingProvider()
+    router = ProviderRouter([bad, FakeProvider()], hedge=False, failure_threshold=1, reset_timeout=60)
+
+    router.generate(messages)
+    assert router.routes[0].breaker.state == CircuitBreaker.OPEN
+    router.generate(messages)
+    assert bad.calls == 1
+
+
+def test_only_open_circuits_raise(messages):
+    router = ProviderRouter([FailingProvider()], failure_threshold=1, reset_timeout=60)
+
+    with pytest.raises(ProviderError):
+        router.generate(messages)
+    with pytest.raises(ProviderError, match='circuits open'):
+        router.generate(messages)
+
+
+def test_hedged_request_answers_when_primary_is_slow(messages):
+    slow = named(FakeProvider(latency=2.0), 'slow')
+    router = ProviderRouter([slow, FakeProvider()], default_hedge_delay=0.05, min_hedge_delay=0.01)
+
+    start = time.monotonic()
+    chunks = list(router.stream(messages))
+    assert time.monotonic() - start < 1.0
+    assert ''.join(chunks) == FakeProvider().generate(messages)
+
+
+def test_no_hedge_before_delay(messages):
+    slow = named(FakeProvider(latency=0.1), 'slow')
+    backup = FailingProvider()
+    router = ProviderRouter([slow, backup], default_hedge_delay=5.0)
+
+    router.generate(messages)
+    assert backup.calls == 0
+
+
+def test_routed_call_fields_reach_request_log(messages):
+    app = Flask(__name__)
+    router = ProviderRouter([InstrumentedProvider(FakeProvider())])
+
+    with app.test_request_context('/'):
+        metrics.start_request('test')
+        router.generate(messages)
+        list(router.stream(messages))
+        timings = dict(g.timings)
+
+    assert timings['provider'] == 'fake'
+    assert timings['routed_provider'] == 'fake'
+    for field in ('llm_ttfb_ms', 'llm_total_ms', 'tokens_in', 'tokens_out'):
+        assert field in timings
+
+
+def test_abandoned_stream_records_only_time_to_first_chunk(messages):
+    router = ProviderRouter([FakeProvider(tokens_per_second=20)], hedge=False)
+
+    stream = router.stream(messages)
+    next(stream)
+    time.sleep(0.3)
+    # The client disconnects mid-stream
+    stream.close()
+
+    samples = list(router.routes[0].health._latencies['stream'])
+    assert len(samples) == 1
+    assert samples[0] < 0.2
+
+
+class MidStreamFailure(FakeProvider):
+    """Fake provider that fails after producing some output."""
+
+    def __init__(self, **kwargs):
+        super().__init__(max_retries=0, **kwargs)
+
+    def _generate(self, messages, system_prompt):
+        raise RuntimeError("connection reset")
+
+    def _stream(self, messages, system_prompt):
+        yield 'partial '
+        raise RuntimeError("connection reset")
+
+
+def test_failed_generations_are_not_persisted(client, conversation_id, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, 'provider', ProviderRouter([MidStreamFailure()], hedge=False))
+
+    response = client.post('/api/send_message_stream',
+                           json={'message': 'first', 'conversation_id': conversation_id})
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert events[-1]['type'] == 'error'
+
+    response = client.post('/api/send_message', json={'message': 'second', 'conversation_id': conversation_id})
+    assert response.status_code == 502
+
+    page = client.get(f'/api/conversations/{conversation_id}').get_json()
+    assert [(msg['role'], msg['content']) for msg in page['messages']] == [('user', 'first'), ('user', 'second')]
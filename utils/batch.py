@@ -0,0 +1,360 @@
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows: jobs are only guarded within one process
+    fcntl = None
+
+from utils.rate_limit import MemoryLimiterBackend
+
+logger = logging.getLogger(__name__)
+
+
+def parse_item(record, line_number):
+    """
+    Turn one JSONL record into a batch item.
+
+    Accepted shapes:
+        {"id": ..., "messages": [{"role": ..., "content": ...}, ...]}
+        {"id": ..., "prompt": "..."}
+        {"request_id": ..., "title": ..., "body": ...}   (requests.jsonl)
+
+    Records without an ID are numbered by line.
+
+    Returns:
+        Dict with 'id' and 'messages'
+    """
+    item_id = record.get('id') or record.get('request_id') or f"line-{line_number}"
+
+    if 'messages' in record:
+        messages = [{'role': msg['role'], 'content': msg['content']} for msg in record['messages']]
+    elif 'prompt' in record:
+        messages = [{'role': 'user', 'content': record['prompt']}]
+    elif 'body' in record:
+        prompt = f"{record['title']}\n\n{record['body']}" if record.get('title') else record['body']
+        messages = [{'role': 'user', 'content': prompt}]
+    else:
+        raise ValueError(f"Line {line_number}: expected 'messages', 'prompt' or 'body'")
+
+    if not messages or messages[-1]['role'] != 'user':
+        raise ValueError(f"Line {line_number}: conversation must end with a user message")
+    return {'id': str(item_id), 'messages': messages}
+
+
+def read_items(path):
+    """Yield batch items from a JSONL file, skipping blank lines."""
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                yield parse_item(json.loads(line), line_number)
+
+
+def completed_ids(output_path):
+    """
+    Return the IDs already finished successfully in an output file.
+
+    The output file doubles as the checkpoint: a resumed run skips these
+    items and retries the ones that failed. A partially written last line
+    (from a crash mid-write) is ignored.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if result.get('error') is None:
+                done.add(result['id'])
+            else:
+                done.discard(result['id'])
+    return done
+
+
+class BatchRunner:
+    """
+    Runs JSONL conversations through a provider with a bounded worker pool.
+
+    Items are read lazily and at most workers * 2 are queued at a time, so
+    memory stays flat for large inputs. A client-side token bucket keeps
+    the request rate under the provider's limit; the provider's own retries
+    handle the occasional 429. Each result is appended to the output file
+    as soon as it completes.
+    """
+
+    def __init__(self, provider, workers=4, rate_per_second=0, progress_interval=10, on_progress=None):
+        """
+        Args:
+            provider: Provider (or wrapper) with a generate(messages) method
+            workers: Number of concurrent provider calls
+            rate_per_second: Maximum requests started per second (0 for unlimited)
+            progress_interval: Seconds between progress reports
+            on_progress: Optional callable receiving the stats dict on each report
+        """
+        self.provider = provider
+        self.workers = workers
+        self.rate_per_second = rate_per_second
+        self.progress_interval = progress_interval
+        self.on_progress = on_progress
+        self._limiter = MemoryLimiterBackend()
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def _throttle(self):
+        if not self.rate_per_second:
+            return
+        while True:
+            wait = self._limiter.take_token('batch', self.rate_per_second, max(1, self.workers))
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def _run_item(self, item):
+        self._throttle()
+        start = time.perf_counter()
+        result = {'id': item['id'], 'provider': self.provider.name, 'model': self.provider.model}
+        try:
+            result['response'] = self.provider.generate(item['messages'])
+            result['error'] = None
+        except Exception as e:
+            result['response'] = None
+            result['error'] = str(e)
+        result['latency_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        return result
+
+    def _report(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_report < self.progress_interval:
+                return
+            self._last_report = now
+            elapsed = now - self._started
+            self.stats['elapsed_s'] = round(elapsed, 2)
+            self.stats['items_per_s'] = round(self.stats['processed'] / elapsed, 3) if elapsed else 0.0
+            stats = dict(self.stats)
+
+        logger.info("Batch progress: %(processed)d processed (%(failed)d failed, %(skipped)d skipped), "
+                    "%(items_per_s).2f items/s", stats)
+        if self.on_progress:
+            self.on_progress(stats)
+
+    def run(self, input_path, output_path):
+        """
+        Process every item in input_path, appending results to output_path.
+
+        Re-running with the same output file resumes: items already finished
+        successfully are skipped.
+
+        Returns:
+            Final stats dict (processed, succeeded, failed, skipped, elapsed_s, items_per_s)
+        """
+        done = completed_ids(output_path)
+        self.stats = {'processed': 0, 'succeeded': 0, 'failed': 0, 'skipped': 0,
+                      'elapsed_s': 0.0, 'items_per_s': 0.0}
+        self._started = self._last_report = time.monotonic()
+        # Bounds the number of items read ahead of the workers
+        slots = threading.BoundedSemaphore(self.workers * 2)
+
+        with open(output_path, 'a', encoding='utf-8') as output, \
+                ThreadPoolExecutor(max_workers=self.workers) as executor:
+
+            def write_result(future):
+                try:
+                    result = future.result()
+                    with self._lock:
+                        output.write(json.dumps(result) + '\n')
+                        output.flush()
+                        self.stats['processed'] += 1
+                        self.stats['succeeded' if result['error'] is None else 'failed'] += 1
+                finally:
+                    slots.release()
+                self._report()
+
+            for item in read_items(input_path):
+                if item['id'] in done:
+                    with self._lock:
+                        self.stats['skipped'] += 1
+                    continue
+                slots.acquire()
+                executor.submit(self._run_item, item).add_done_callback(write_result)
+
+        self._report(force=True)
+        return self.stats
+
+
+class BatchJobs:
+    """
+    Background batch jobs for the /api/batch endpoint.
+
+    Each job keeps its input, output and status as files in directory, so
+    any worker process on the host can report a job's progress and an
+    interrupted job can be resumed from its output checkpoint. A running job
+    holds an exclusive lock on its lock file, so only one worker process can
+    run it at a time, and a job whose process died is reported as
+    'interrupted' instead of 'running'.
+    """
+
+    def __init__(self, provider, directory, workers=4, rate_per_second=0, progress_interval=5):
+        self.provider = provider
+        self.directory = directory
+        self.workers = workers
+        self.rate_per_second = rate_per_second
+        self.progress_interval = progress_interval
+        self._lock = threading.Lock()
+        self._running = set()
+        self._status_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    FILES = {'input': '{}.input.jsonl', 'output': '{}.output.jsonl', 'status': '{}.status.json',
+             'lock': '{}.lock'}
+
+    def _path(self, job_id, kind):
+        # Job IDs come from URLs; only accept the hex IDs we generate
+        if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+            raise KeyError(job_id)
+        return os.path.join(self.directory, self.FILES[kind].format(job_id))
+
+    def _read_status(self, job_id):
+        try:
+            with open(self._path(job_id, 'status'), encoding='utf-8') as f:
+                return json.load(f)
+        except (KeyError, FileNotFoundError):
+            return None
+
+    def _write_status(self, job_id, **fields):
+        path = self._path(job_id, 'status')
+        with self._status_lock:
+            status = self._read_status(job_id) or {}
+            status.update(fields)
+            # Write-then-rename so readers never see a half-written file
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(status, f)
+            os.replace(path + '.tmp', path)
+
+    def create(self, lines):
+        """
+        Validate and store a job's input, then start it.
+
+        Args:
+            lines: Iterable of JSONL lines
+
+        Returns:
+            New job ID
+
+        Raises:
+            ValueError: If any line is not a valid batch item
+        """
+        items = [parse_item(json.loads(line), number) for number, line in enumerate(lines, 1) if line.strip()]
+        if not items:
+            raise ValueError("Batch input is empty")
+
+        job_id = uuid.uuid4().hex
+        with open(self._path(job_id, 'input'), 'w', encoding='utf-8') as f:
+            for item in items:
+                f.write(json.dumps(item) + '\n')
+        self._write_status(job_id, id=job_id, state='queued', total=len(items), created_at=time.time())
+        self.start(job_id)
+        return job_id
+
+    def _acquire(self, job_id):
+        """Take the job's run lock. Returns the open lock file, or None if the job is running."""
+        with self._lock:
+            if job_id in self._running:
+                return None
+            lock_file = open(self._path(job_id, 'lock'), 'a')
+            if fcntl is not None:
+                try:
+                    # Held until the run ends; the OS drops it if the process dies
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    lock_file.close()
+                    return None
+            self._running.add(job_id)
+            return lock_file
+
+    def _release(self, job_id, lock_file):
+        with self._lock:
+            self._running.discard(job_id)
+            lock_file.close()
+
+    def _is_running(self, job_id):
+        """Return True if any process holds the job's run lock."""
+        with self._lock:
+            if job_id in self._running:
+                return True
+        if fcntl is None:
+            return False
+        try:
+            with open(self._path(job_id, 'lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        return False
+
+    def start(self, job_id):
+        """
+        Run (or resume) a job in a background thread.
+
+        Returns:
+            False if the job is already running in any process on the host
+        """
+        lock_file = self._acquire(job_id)
+        if lock_file is None:
+            return False
+
+        runner = BatchRunner(self.provider, workers=self.workers, rate_per_second=self.rate_per_second,
+                             progress_interval=self.progress_interval,
+                             on_progress=lambda stats: self._write_status(job_id, **stats))
+
+        def run():
+            try:
+                self._write_status(job_id, state='running')
+                stats = runner.run(self._path(job_id, 'input'), self._path(job_id, 'output'))
+                self._write_status(job_id, state='completed', finished_at=time.time(), **stats)
+            except Exception as e:
+                logger.exception("Batch job %s failed", job_id)
+                self._write_status(job_id, state='failed', error=str(e))
+            finally:
+                self._release(job_id, lock_file)
+
+        threading.Thread(target=run, name=f"batch-{job_id}", daemon=True).start()
+        return True
+
+    def status(self, job_id):
+        """Return a job's status dict, or None if the job doesn't exist."""
+        status = self._read_status(job_id)
+        # The process running it was restarted or killed; the job can be resumed
+        if status is not None and status.get('state') == 'running' and not self._is_running(job_id):
+            status['state'] = 'interrupted'
+        return status
+
+    def output_path(self, job_id):
+        """Return the path of a job's results file."""
+        return self._path(job_id, 'output')
+
+
+def batch_jobs_from_env(provider):
+    """
+    Create the batch job manager from environment configuration.
+
+    The endpoint is disabled (returns None) unless BATCH_API_TOKEN is set,
+    since jobs spend provider quota outside the per-session rate limits.
+    BATCH_DIR, BATCH_WORKERS and BATCH_RATE_PER_SEC configure the jobs.
+    """
+    if not os.environ.get('BATCH_API_TOKEN'):
+        return None
+    return BatchJobs(
+        provider,
+        os.environ.get('BATCH_DIR', os.path.join('instance', 'batches')),
+        workers=int(os.environ.get('BATCH_WORKERS', '4')),
+        rate_per_second=float(os.environ.get('BATCH_RATE_PER_SEC', '0')),
+    )
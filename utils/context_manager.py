@@ -0,0 +1,133 @@
+import os
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Prompt token budget per model. These are deliberately far below the models'
+# real context windows: the budget bounds per-turn cost and latency, and older
+# turns are folded into the rolling summary instead of being resent.
+MODEL_TOKEN_BUDGETS = {
+    'gemini-1.5-pro': 24000,
+    'gpt-4o': 16000,
+}
+DEFAULT_TOKEN_BUDGET = 16000
+
+# Rough per-message overhead for role markers and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PREFIX = "Summary of the earlier part of this conversation:\n"
+
+
+def estimate_tokens(text):
+    """
+    Estimate the number of tokens in a piece of text.
+
+    Uses the common ~4 characters per token approximation, which is close
+    enough for budgeting and avoids a tokenizer dependency per provider.
+
+    Args:
+        text: The text to measure
+
+    Returns:
+        Estimated token count, including per-message overhead
+    """
+    return math.ceil(len(text or '') / 4) + MESSAGE_OVERHEAD_TOKENS
+
+
+def get_token_budget(model):
+    """
+    Return the prompt token budget for a model.
+
+    CONTEXT_TOKEN_BUDGET overrides the budget for every model.
+    """
+    override = os.environ.get('CONTEXT_TOKEN_BUDGET')
+    if override:
+        return int(override)
+    return MODEL_TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET)
+
+
+class ContextManager:
+    """
+    Builds the message list sent to the model for each turn.
+
+    Recent messages are included verbatim, newest first, until the token
+    budget is used up. Anything older is folded into a rolling summary that
+    is stored with the conversation. The summary is only ever extended with
+    the messages that newly fell out of the window, never rebuilt from
+    scratch, and the window is trimmed to a low-water mark when it overflows
+    so that summarization runs in occasional batches rather than every turn.
+    """
+
+    def __init__(self, store, summarize, model, budget=None, summary_ratio=0.125, low_water=0.5):
+        """
+        Args:
+            store: ConversationStore used to persist the summary
+            summarize: Callable (previous_summary, messages) -> new summary text
+            model: Model name, used to look up the token budget
+            budget: Explicit token budget (defaults to get_token_budget(model))
+            summary_ratio: Share of the budget reserved for the summary
+            low_water: Share of the recent-message budget kept after folding
+        """
+        self.store = store
+        self.summarize = summarize
+        self.model = model
+        self.budget = budget or get_token_budget(model)
+        self.summary_budget = int(self.budget * summary_ratio)
+        self.recent_budget = self.budget - self.summary_budget
+        self.low_water = low_water
+
+    def _window_start(self, messages, budget):
+        """Return the index of the oldest message that fits in the budget."""
+        total = 0
+        start = len(messages)
+        for index in range(len(messages) - 1, -1, -1):
+            tokens = messages[index]['tokens']
+            # Always keep the latest message, even if it alone exceeds the budget
+            if total + tokens > budget and start < len(messages):
+                break
+            total += tokens
+            start = index
+
+        # Start the window on a user turn so providers see proper alternation
+        while start < len(messages) - 1 and messages[start]['role'] != 'user':
+            start += 1
+        return start
+
+    def build(self, owner_id, conversation):
+        """
+        Build the model context for a conversation.
+
+        Args:
+            owner_id: Owner of the conversation
+            conversation: Conversation dict from the store, including the
+                new user message
+
+        Returns:
+            List of message dicts; the summary, if any, is the first entry
+            with role 'system'
+        """
+        summary = conversation.get('summary') or ''
+        summary_upto = conversation.get('summary_upto') or 0
+        pending = [msg for msg in conversation['messages'] if msg['id'] > summary_upto]
+
+        start = self._window_start(pending, self.recent_budget)
+        if start > 0:
+            full_start = start
+            # Overflow: shrink the window so the next few turns fit without folding again
+            start = self._window_start(pending, int(self.recent_budget * self.low_water))
+            folded = pending[:start]
+            try:
+                summary = self.summarize(summary, folded)
+                self.store.set_summary(owner_id, conversation['id'], summary, folded[-1]['id'])
+            except Exception:
+                # Keep the old summary and send as much as fits in the full budget;
+                # the folding will be retried next turn
+                logger.exception("Failed to update conversation summary")
+                start = full_start
+
+        context = []
+        if summary:
+            context.append({'role': 'system', 'content': SUMMARY_PREFIX + summary})
+        context.extend({'role': msg['role'], 'content': msg['content']} for msg in pending[start:])
+        return context
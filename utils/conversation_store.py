@@ -0,0 +1,458 @@
+import os
+import uuid
+import bisect
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from flask_sqlalchemy import SQLAlchemy
+
+from utils.context_manager import estimate_tokens
+
+# Shared SQLAlchemy handle, bound to the Flask app in init_conversation_store()
+db = SQLAlchemy()
+
+DEFAULT_TITLE = 'New conversation'
+
+
+class Conversation(db.Model):
+    """Conversation header row. Listing conversations only ever reads this table."""
+    __tablename__ = 'conversations'
+    __table_args__ = (
+        db.Index('ix_conversations_owner_created', 'owner_id', 'created_at'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True)
+    owner_id = db.Column(db.String(36), nullable=False)
+    title = db.Column(db.String(255), nullable=False, default=DEFAULT_TITLE)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Rolling summary of every message up to and including summary_message_id
+    summary = db.Column(db.Text, nullable=True)
+    summary_message_id = db.Column(db.Integer, nullable=False, default=0)
+    # Bumped on every visible change; used for ETags
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Message(db.Model):
+    """A single message, appended individually to its conversation."""
+    __tablename__ = 'messages'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    conversation_id = db.Column(db.String(36), db.ForeignKey('conversations.id'),
+                                nullable=False, index=True)
+    role = db.Column(db.String(16), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    # Cached token estimate so context budgeting never re-measures old messages
+    token_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class ConversationStore:
+    """
+    Server-side storage for conversations and their messages.
+
+    Every method is scoped by owner_id (the only identifier kept in the
+    session cookie), so a client can never read or modify another owner's
+    conversations by guessing a conversation ID.
+    """
+
+    def create_conversation(self, owner_id, title=DEFAULT_TITLE):
+        """Create an empty conversation and return its ID."""
+        raise NotImplementedError
+
+    def list_conversations(self, owner_id):
+        """Return [{'id': ..., 'title': ...}] in creation order, without loading messages."""
+        raise NotImplementedError
+
+    def has_conversation(self, owner_id, conversation_id):
+        """Return True if the conversation exists and belongs to owner_id."""
+        raise NotImplementedError
+
+    def get_header(self, owner_id, conversation_id):
+        """
+        Return the conversation without its messages, or None if it doesn't exist.
+
+        The result has 'id', 'title', 'summary', 'summary_upto' and 'version';
+        version changes whenever the title or the messages change.
+        """
+        raise NotImplementedError
+
+    def get_conversation(self, owner_id, conversation_id, unsummarized_only=False):
+        """
+        Return the conversation or None if it doesn't exist.
+
+        The result is the header plus 'messages'; each message has 'id',
+        'role', 'content' and a cached 'tokens' count. Message IDs increase
+        with insertion order. With unsummarized_only, messages already
+        folded into the summary are not loaded.
+        """
+        raise NotImplementedError
+
+    def get_messages(self, owner_id, conversation_id, before=None, limit=50):
+        """
+        Return one page of messages, newest first by cursor.
+
+        Args:
+            owner_id: Owner of the conversation
+            conversation_id: Conversation to read
+            before: Only return messages with an ID lower than this cursor
+            limit: Maximum number of messages to return
+
+        Returns:
+            (messages, has_more) with messages oldest first, or None if the
+            conversation doesn't exist
+        """
+        raise NotImplementedError
+
+    def append_message(self, owner_id, conversation_id, role, content):
+        """Append one message to the conversation and return it."""
+        raise NotImplementedError
+
+    def set_summary(self, owner_id, conversation_id, summary, upto_message_id):
+        """Store the rolling summary covering messages up to upto_message_id."""
+        raise NotImplementedError
+
+    def set_title(self, owner_id, conversation_id, title):
+        """Rename a conversation."""
+        raise NotImplementedError
+
+    def clear_conversation(self, owner_id, conversation_id):
+        """Remove all messages and reset the title and summary."""
+        raise NotImplementedError
+
+    def delete_conversation(self, owner_id, conversation_id):
+        """Delete a conversation and all of its messages."""
+        raise NotImplementedError
+
+    def release(self):
+        """
+        Give back any database connection held by the current request.
+
+        Call before a slow provider call so a request waiting on the model
+        doesn't pin a pooled connection. The store stays usable afterwards.
+        """
+
+
+class SQLAlchemyConversationStore(ConversationStore):
+    """Conversation store backed by SQLite (or any SQLAlchemy database URL)."""
+
+    def _get_header(self, owner_id, conversation_id):
+        if not conversation_id:
+            return None
+        conversation = db.session.get(Conversation, conversation_id)
+        if conversation is None or conversation.owner_id != owner_id:
+            return None
+        return conversation
+
+    def create_conversation(self, owner_id, title=DEFAULT_TITLE):
+        conversation_id = str(uuid.uuid4())
+        db.session.add(Conversation(id=conversation_id, owner_id=owner_id, title=title))
+        db.session.commit()
+        return conversation_id
+
+    def list_conversations(self, owner_id):
+        rows = (db.session.query(Conversation.id, Conversation.title)
+                .filter(Conversation.owner_id == owner_id)
+                .order_by(Conversation.created_at)
+                .all())
+        return [{'id': row.id, 'title': row.title} for row in rows]
+
+    def has_conversation(self, owner_id, conversation_id):
+        return self._get_header(owner_id, conversation_id) is not None
+
+    @staticmethod
+    def _header_dict(conversation):
+        return {
+            'id': conversation.id,
+            'title': conversation.title,
+            'summary': conversation.summary,
+            'summary_upto': conversation.summary_message_id,
+            'version': conversation.version,
+        }
+
+    @staticmethod
+    def _message_dict(row):
+        return {'id': row.id, 'role': row.role, 'content': row.content, 'tokens': row.token_count}
+
+    def get_header(self, owner_id, conversation_id):
+        conversation = self._get_header(owner_id, conversation_id)
+        if conversation is None:
+            return None
+        return self._header_dict(conversation)
+
+    def get_conversation(self, owner_id, conversation_id, unsummarized_only=False):
+        conversation = self._get_header(owner_id, conversation_id)
+        if conversation is None:
+            return None
+
+        query = (db.session.query(Message.id, Message.role, Message.content, Message.token_count)
+                 .filter(Message.conversation_id == conversation_id))
+        if unsummarized_only:
+            query = query.filter(Message.id > conversation.summary_message_id)
+        result = self._header_dict(conversation)
+        result['messages'] = [self._message_dict(row) for row in query.order_by(Message.id).all()]
+        return result
+
+    def get_messages(self, owner_id, conversation_id, before=None, limit=50):
+        if self._get_header(owner_id, conversation_id) is None:
+            return None
+
+        query = (db.session.query(Message.id, Message.role, Message.content, Message.token_count)
+                 .filter(Message.conversation_id == conversation_id))
+        if before is not None:
+            query = query.filter(Message.id < before)
+        # Fetch one extra row to know whether an older page exists
+        rows = query.order_by(Message.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        return [self._message_dict(row) for row in reversed(rows[:limit])], has_more
+
+    def append_message(self, owner_id, conversation_id, role, content):
+        conversation = self._get_header(owner_id, conversation_id)
+        if conversation is None:
+            raise KeyError(conversation_id)
+
+        message = Message(conversation_id=conversation_id, role=role, content=content,
+                          token_count=estimate_tokens(content))
+        db.session.add(message)
+        # Incremented in SQL so concurrent writers don't lose updates
+        conversation.version = Conversation.version + 1
+        # Flush to get the ID, and build the result before committing: reading the
+        # expired row afterwards would open a new transaction holding a pooled connection
+        db.session.flush()
+        result = {'id': message.id, 'role': role, 'content': content, 'tokens': message.token_count}
+        db.session.commit()
+        return result
+
+    def set_summary(self, owner_id, conversation_id, summary, upto_message_id):
+        conversation = self._get_header(owner_id, conversation_id)
+        if conversation is None:
+            raise KeyError(conversation_id)
+
+        conversation.summary = summary
+        conversation.summary_message_id = upto_message_id
+        db.session.commit()
+
+    def set_title(self, owner_id, conversation_id, title):
+        conversation = self._get_header(owner_id, conversation_id)
+        if conversation is None:
+            raise KeyError(conversation_id)
+
+        conversation.title = title
+        conversation.version = Conversation.version + 1
+        db.session.commit()
+
+    def clear_conversation(self, owner_id, conversation_id):
+        conversation = self._get_header(owner_id, conversation_id)
+        if conversation is None:
+            raise KeyError(conversation_id)
+
+        Message.query.filter_by(conversation_id=conversation_id).delete()
+        conversation.title = DEFAULT_TITLE
+        conversation.summary = None
+        conversation.summary_message_id = 0
+        conversation.version = Conversation.version + 1
+        db.session.commit()
+
+    def delete_conversation(self, owner_id, conversation_id):
+        conversation = self._get_header(owner_id, conversation_id)
+        if conversation is None:
+            raise KeyError(conversation_id)
+
+        Message.query.filter_by(conversation_id=conversation_id).delete()
+        db.session.delete(conversation)
+        db.session.commit()
+
+    def release(self):
+        # Ends the session's transaction and returns its connection to the pool
+        db.session.close()
+
+
+class MemoryConversationStore(ConversationStore):
+    """
+    In-process conversation store with LRU eviction.
+
+    Useful for development and single-worker deployments. Once more than
+    max_conversations are held, the least recently used conversation is
+    dropped. Data does not survive a restart and is not shared between workers.
+    """
+
+    def __init__(self, max_conversations=1000):
+        self.max_conversations = max_conversations
+        self._lock = threading.Lock()
+        # conversation_id -> {'owner_id', 'title', 'summary', 'summary_upto', 'version', 'messages'},
+        # in LRU order
+        self._conversations = OrderedDict()
+        self._next_message_id = 1
+        # owner_id -> list of conversation IDs in creation order (the "title index")
+        self._owners = {}
+
+    def _get(self, owner_id, conversation_id):
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None or conversation['owner_id'] != owner_id:
+            return None
+        self._conversations.move_to_end(conversation_id)
+        return conversation
+
+    def _require(self, owner_id, conversation_id):
+        conversation = self._get(owner_id, conversation_id)
+        if conversation is None:
+            raise KeyError(conversation_id)
+        return conversation
+
+    def _remove(self, conversation_id):
+        conversation = self._conversations.pop(conversation_id)
+        owned = self._owners.get(conversation['owner_id'], [])
+        if conversation_id in owned:
+            owned.remove(conversation_id)
+        if not owned:
+            self._owners.pop(conversation['owner_id'], None)
+
+    def create_conversation(self, owner_id, title=DEFAULT_TITLE):
+        conversation_id = str(uuid.uuid4())
+        with self._lock:
+            self._conversations[conversation_id] = {
+                'owner_id': owner_id,
+                'title': title,
+                'summary': None,
+                'summary_upto': 0,
+                'version': 0,
+                'messages': []
+            }
+            self._owners.setdefault(owner_id, []).append(conversation_id)
+
+            # Evict least recently used conversations beyond the limit
+            while len(self._conversations) > self.max_conversations:
+                self._remove(next(iter(self._conversations)))
+        return conversation_id
+
+    def list_conversations(self, owner_id):
+        with self._lock:
+            return [{'id': conversation_id, 'title': self._conversations[conversation_id]['title']}
+                    for conversation_id in self._owners.get(owner_id, [])]
+
+    def has_conversation(self, owner_id, conversation_id):
+        with self._lock:
+            return self._get(owner_id, conversation_id) is not None
+
+    @staticmethod
+    def _header_dict(conversation_id, conversation):
+        return {
+            'id': conversation_id,
+            'title': conversation['title'],
+            'summary': conversation['summary'],
+            'summary_upto': conversation['summary_upto'],
+            'version': conversation['version'],
+        }
+
+    def get_header(self, owner_id, conversation_id):
+        with self._lock:
+            conversation = self._get(owner_id, conversation_id)
+            if conversation is None:
+                return None
+            return self._header_dict(conversation_id, conversation)
+
+    def get_conversation(self, owner_id, conversation_id, unsummarized_only=False):
+        with self._lock:
+            conversation = self._get(owner_id, conversation_id)
+            if conversation is None:
+                return None
+            messages = conversation['messages']
+            if unsummarized_only:
+                messages = [message for message in messages if message['id'] > conversation['summary_upto']]
+            result = self._header_dict(conversation_id, conversation)
+            result['messages'] = [dict(message) for message in messages]
+            return result
+
+    def get_messages(self, owner_id, conversation_id, before=None, limit=50):
+        with self._lock:
+            conversation = self._get(owner_id, conversation_id)
+            if conversation is None:
+                return None
+            messages = conversation['messages']
+            # Message IDs are increasing, so the cursor position can be bisected
+            end = len(messages)
+            if before is not None:
+                end = bisect.bisect_left(messages, before, key=lambda message: message['id'])
+            start = max(0, end - limit)
+            return [dict(message) for message in messages[start:end]], start > 0
+
+    def append_message(self, owner_id, conversation_id, role, content):
+        with self._lock:
+            conversation = self._require(owner_id, conversation_id)
+            message = {'id': self._next_message_id, 'role': role, 'content': content,
+                       'tokens': estimate_tokens(content)}
+            self._next_message_id += 1
+            conversation['messages'].append(message)
+            conversation['version'] += 1
+        return dict(message)
+
+    def set_summary(self, owner_id, conversation_id, summary, upto_message_id):
+        with self._lock:
+            conversation = self._require(owner_id, conversation_id)
+            conversation['summary'] = summary
+            conversation['summary_upto'] = upto_message_id
+
+    def set_title(self, owner_id, conversation_id, title):
+        with self._lock:
+            conversation = self._require(owner_id, conversation_id)
+            conversation['title'] = title
+            conversation['version'] += 1
+
+    def clear_conversation(self, owner_id, conversation_id):
+        with self._lock:
+            conversation = self._require(owner_id, conversation_id)
+            conversation['messages'] = []
+            conversation['title'] = DEFAULT_TITLE
+            conversation['summary'] = None
+            conversation['summary_upto'] = 0
+            conversation['version'] += 1
+
+    def delete_conversation(self, owner_id, conversation_id):
+        with self._lock:
+            self._require(owner_id, conversation_id)
+            self._remove(conversation_id)
+
+
+def init_conversation_store(app):
+    """
+    Create the conversation store selected by the CONVERSATION_STORE env var.
+
+    Args:
+        app: Flask application (used to bind SQLAlchemy for the sqlite backend)
+
+    Returns:
+        A ConversationStore instance
+    """
+    backend = os.environ.get('CONVERSATION_STORE', 'sqlite').lower()
+
+    if backend == 'memory':
+        max_conversations = int(os.environ.get('CONVERSATION_STORE_MAX', '1000'))
+        return MemoryConversationStore(max_conversations=max_conversations)
+
+    if backend not in ('sqlite', 'sql', 'sqlalchemy'):
+        raise ValueError(f"Unknown CONVERSATION_STORE backend: {backend}")
+
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI',
+                          os.environ.get('DATABASE_URL', 'sqlite:///chat.db'))
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {
+        'pool_recycle': 300,
+        'pool_pre_ping': True,
+    })
+    db.init_app(app)
+    # Under gunicorn the master creates the schema before forking, so workers
+    # don't race each other to create the same tables
+    if not os.environ.get('CONVERSATION_SCHEMA_READY'):
+        with app.app_context():
+            db.create_all()
+
+    return SQLAlchemyConversationStore()
+
+
+if __name__ == '__main__':
+    # Create the schema once, outside the workers: `python -m utils.conversation_store`
+    from flask import Flask
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    # Named after the app module so relative sqlite paths resolve to the same instance folder
+    init_conversation_store(Flask('app'))
@@ -0,0 +1,423 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, has_request_context
+
+from utils.context_manager import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers both fast stages (store, serialization) and slow LLM calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 500, 1000)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Metric:
+    """Base class for a labelled metric family."""
+
+    type = None
+    # Whether samples from worker processes that have exited still count when merging
+    live_only = False
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def snapshot(self):
+        """Return the current samples as {label values: value}."""
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, snapshots):
+        """Combine snapshots from several processes into one; counts are summed."""
+        merged = {}
+        for values in snapshots:
+            for key, value in values.items():
+                merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def _render_samples(self, values):
+        return [f'{self.name}{_format_labels(self.label_names, key)} {value}'
+                for key, value in sorted(values.items())]
+
+    def render(self, values=None):
+        """Render the samples in values, or this process's own samples."""
+        if values is None:
+            values = self.snapshot()
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.type}']
+        lines.extend(self._render_samples(values))
+        return lines
+
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Point-in-time value, read from a callback at scrape time.
+
+    With labels, the callback returns a dict mapping label value tuples to values.
+    Across worker processes, the values of running workers are combined with
+    aggregate: 'sum' (e.g. requests in flight) or 'max' (e.g. whether any
+    worker sees a provider's circuit open).
+    """
+
+    type = 'gauge'
+    live_only = True
+
+    def __init__(self, name, help_text, callback, labels=(), aggregate='sum'):
+        super().__init__(name, help_text, labels)
+        self.callback = callback
+        self.aggregate = aggregate
+
+    def snapshot(self):
+        if not self.label_names:
+            return {(): self.callback()}
+        return dict(self.callback())
+
+    def merge(self, snapshots):
+        if self.aggregate == 'sum':
+            return super().merge(snapshots)
+        merged = {}
+        for values in snapshots:
+            for key, value in values.items():
+                merged[key] = max(merged.get(key, value), value)
+        return merged
+
+
+class CallbackCounter(Gauge):
+    """Counter maintained elsewhere, read from a callback at scrape time."""
+
+    type = 'counter'
+    live_only = False
+
+
+class Histogram(Metric):
+    """Bucketed distribution of observations."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state['counts'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {key: {'counts': list(state['counts']), 'sum': state['sum'], 'count': state['count']}
+                    for key, state in self._values.items()}
+
+    def merge(self, snapshots):
+        merged = {}
+        for values in snapshots:
+            for key, state in values.items():
+                total = merged.get(key)
+                if total is None:
+                    merged[key] = {'counts': list(state['counts']), 'sum': state['sum'], 'count': state['count']}
+                    continue
+                total['counts'] = [a + b for a, b in zip(total['counts'], state['counts'])]
+                total['sum'] += state['sum']
+                total['count'] += state['count']
+        return merged
+
+    def _render_samples(self, values):
+        lines = []
+        bucket_labels = self.label_names + ('le',)
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(bucket_labels, key + (bound,))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(bucket_labels, key + ("+Inf",))} {state["count"]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.label_names, key)} {state["sum"]}')
+            lines.append(f'{self.name}_count{_format_labels(self.label_names, key)} {state["count"]}')
+        return lines
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    """
+    Collection of metrics rendered together in Prometheus text format.
+
+    Metrics live in each process. With share(), every worker process also
+    writes a snapshot of its metrics to a shared directory, and render()
+    merges the snapshots of all workers. A scrape then covers the whole
+    server, whichever worker answers it.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._directory = None
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def share(self, directory, interval=1.0):
+        """
+        Publish this process's metrics to directory every interval seconds.
+
+        Args:
+            directory: Directory shared by the worker processes (cleared by
+                the server on startup)
+            interval: Seconds between snapshots
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self.flush()
+
+        def flush_periodically():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Failed to write metrics snapshot")
+
+        threading.Thread(target=flush_periodically, name='metrics-flush', daemon=True).start()
+
+    def flush(self):
+        """Write this process's snapshot to the shared directory."""
+        pid = os.getpid()
+        snapshot = {'pid': pid, 'metrics': {
+            metric.name: [[list(key), value] for key, value in metric.snapshot().items()]
+            for metric in list(self._metrics)
+        }}
+        path = os.path.join(self._directory, f'{pid}.json')
+        # Write-then-rename so other workers never read a half-written file
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(path + '.tmp', path)
+
+    def _load_snapshots(self):
+        snapshots = []
+        for filename in os.listdir(self._directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self._directory, filename), encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            snapshots.append((_process_alive(snapshot['pid']), snapshot['metrics']))
+        return snapshots
+
+    def render(self):
+        lines = []
+        if self._directory is None:
+            for metric in self._metrics:
+                lines.extend(metric.render())
+            return '\n'.join(lines) + '\n'
+
+        self.flush()
+        snapshots = self._load_snapshots()
+        for metric in self._metrics:
+            # Exited workers keep contributing counts, so totals never go backwards
+            values = [{tuple(key): value for key, value in samples.get(metric.name, [])}
+                      for alive, samples in snapshots if alive or not metric.live_only]
+            lines.extend(metric.render(metric.merge(values)))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    'chat_http_requests_total', 'HTTP requests by endpoint and status', ('endpoint', 'status')))
+REQUEST_SECONDS = registry.register(Histogram(
+    'chat_http_request_seconds', 'HTTP request duration, including streamed bodies', ('endpoint',)))
+STAGE_SECONDS = registry.register(Histogram(
+    'chat_stage_seconds', 'Time spent in each stage of the chat hot path', ('stage',)))
+APP_ERRORS = registry.register(Counter(
+    'chat_app_errors_total', 'Unhandled route errors by endpoint and exception type', ('endpoint', 'exception')))
+
+LLM_TTFB_SECONDS = registry.register(Histogram(
+    'llm_time_to_first_byte_seconds', 'Time until the provider returned the first chunk', ('provider',)))
+LLM_SECONDS = registry.register(Histogram(
+    'llm_request_seconds', 'Total provider call duration', ('provider',)))
+LLM_TOKENS = registry.register(Counter(
+    'llm_tokens_total', 'Estimated tokens sent to and received from providers', ('provider', 'direction')))
+LLM_TOKENS_PER_SECOND = registry.register(Histogram(
+    'llm_output_tokens_per_second', 'Provider output speed', ('provider',), buckets=RATE_BUCKETS))
+LLM_ERRORS = registry.register(Counter(
+    'llm_errors_total', 'Failed provider calls by provider and exception type', ('provider', 'exception')))
+LLM_HEDGES = registry.register(Counter(
+    'llm_hedged_requests_total', 'Hedged requests sent because the primary provider was slow', ('provider',)))
+LLM_FAILOVERS = registry.register(Counter(
+    'llm_failovers_total', 'Requests retried on another provider after a failure', ('provider',)))
+LLM_CIRCUIT_OPENS = registry.register(Counter(
+    'llm_circuit_opens_total', 'Times a provider circuit breaker opened', ('provider',)))
+
+
+def share_from_env():
+    """
+    Share metrics across worker processes if METRICS_DIR is set.
+
+    gunicorn.conf.py sets METRICS_DIR for its workers; METRICS_FLUSH_INTERVAL
+    (seconds) sets how often each worker publishes its snapshot.
+    """
+    directory = os.environ.get('METRICS_DIR')
+    if directory:
+        registry.share(directory, interval=float(os.environ.get('METRICS_FLUSH_INTERVAL', '1')))
+
+
+def start_request(request_id):
+    """Begin request-scoped timing; call from a before_request hook."""
+    g.request_id = request_id
+    g.request_start = time.perf_counter()
+    g.timings = {}
+
+
+# Log fields recorded by a thread working on behalf of a request, which has no request context
+_captured_fields = ContextVar('captured_fields', default=None)
+
+
+def capture_fields(fields):
+    """
+    Collect record() calls made in the current thread into fields.
+
+    For background threads serving a request; the request thread passes the
+    fields it wants to keep to record() itself.
+    """
+    _captured_fields.set(fields)
+
+
+def record(name, value):
+    """Attach a value to the current request's log line (no-op outside a request)."""
+    captured = _captured_fields.get()
+    if captured is not None:
+        captured[name] = value
+    elif has_request_context() and hasattr(g, 'timings'):
+        g.timings[name] = value
+
+
+@contextmanager
+def timed(stage):
+    """Time a block as a chat stage and add it to the request's log line."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        record(stage + '_ms', round(elapsed * 1000, 2))
+
+
+class InstrumentedProvider:
+    """
+    Provider wrapper that records latency, token and error metrics.
+
+    Exposes the same generate/stream/summarize interface as Provider.
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.name = provider.name
+        self.model = provider.model
+
+    def _observe(self, messages, output, start, first_byte):
+        total = time.perf_counter() - start
+        tokens_in = sum(estimate_tokens(msg['content']) for msg in messages)
+        tokens_out = estimate_tokens(output)
+
+        LLM_TTFB_SECONDS.observe(first_byte - start, provider=self.name)
+        LLM_SECONDS.observe(total, provider=self.name)
+        LLM_TOKENS.inc(tokens_in, provider=self.name, direction='in')
+        LLM_TOKENS.inc(tokens_out, provider=self.name, direction='out')
+        if total > 0:
+            LLM_TOKENS_PER_SECOND.observe(tokens_out / total, provider=self.name)
+
+        record('provider', self.name)
+        record('llm_ttfb_ms', round((first_byte - start) * 1000, 2))
+        record('llm_total_ms', round(total * 1000, 2))
+        record('tokens_in', tokens_in)
+        record('tokens_out', tokens_out)
+
+    def _error(self, e):
+        cause = e.__cause__ or e
+        LLM_ERRORS.inc(provider=self.name, exception=type(cause).__name__)
+        record('provider_error', type(cause).__name__)
+
+    def generate(self, messages, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            output = self.provider.generate(messages, *args, **kwargs)
+        except Exception as e:
+            self._error(e)
+            raise
+        end = time.perf_counter()
+        self._observe(messages, output, start, end)
+        return output
+
+    def stream(self, messages, *args, **kwargs):
+        start = time.perf_counter()
+        first_byte = None
+        chunks = []
+        try:
+            for text in self.provider.stream(messages, *args, **kwargs):
+                if first_byte is None:
+                    first_byte = time.perf_counter()
+                chunks.append(text)
+                yield text
+        except Exception as e:
+            self._error(e)
+            raise
+        self._observe(messages, ''.join(chunks), start, first_byte or time.perf_counter())
+
+    def summarize(self, summary, messages):
+        # Goes through generate() on the wrapped provider, so time it as a stage
+        with timed('summarize'):
+            try:
+                return self.provider.summarize(summary, messages)
+            except Exception as e:
+                self._error(e)
+                raise
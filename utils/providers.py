@@ -0,0 +1,384 @@
+import os
+import time
+import random
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = ("You are a helpful, creative, and knowledgeable assistant. Provide detailed, accurate responses. "
+                 "When you include code snippets, make sure they are functional and properly formatted. "
+                 "Format your responses using markdown for better readability.")
+
+SUMMARY_INSTRUCTIONS = ("Update the running summary of a conversation between a user and an assistant. "
+                        "Keep facts, decisions, names, code identifiers and open questions that later turns "
+                        "may refer to. Reply with the updated summary only, in at most 250 words.")
+
+
+class ProviderError(Exception):
+    """Raised when a provider call fails after all retries."""
+
+    def __init__(self, provider, message):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+
+
+def build_summary_prompt(summary, messages):
+    """
+    Build the prompt that folds new messages into an existing summary.
+
+    Args:
+        summary: The current summary text (may be empty)
+        messages: Messages to fold in, oldest first
+
+    Returns:
+        Prompt string for the summarization call
+    """
+    transcript = "\n\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+    return (f"Current summary:\n{summary or '(none)'}\n\n"
+            f"New messages:\n{transcript}")
+
+
+class Provider:
+    """
+    Base class for LLM providers.
+
+    Subclasses create their client/model objects once in __init__ and reuse
+    them (and their pooled HTTP connections) for every call. They implement
+    _generate() and _stream(); the public methods add per-call timeouts and
+    bounded retries with jitter for the errors listed in retryable_errors.
+    """
+
+    name = None
+    default_model = None
+    # Exception types worth retrying (timeouts, rate limits, 5xx)
+    retryable_errors = ()
+
+    def __init__(self, model=None, timeout=60.0, max_retries=2, retry_base_delay=0.5):
+        self.model = model or self.default_model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+
+    def _generate(self, messages, system_prompt):
+        raise NotImplementedError
+
+    def _stream(self, messages, system_prompt):
+        raise NotImplementedError
+
+    def _backoff(self, attempt):
+        # Full jitter: sleep a random time up to the exponential backoff cap
+        time.sleep(random.uniform(0, self.retry_base_delay * (2 ** attempt)))
+
+    def generate(self, messages, system_prompt=SYSTEM_PROMPT):
+        """
+        Generate a complete response.
+
+        Args:
+            messages: List of message objects with 'role' and 'content' fields
+            system_prompt: Instructions for the model
+
+        Returns:
+            String containing the AI's response
+
+        Raises:
+            ProviderError: If the call fails after all retries
+        """
+        attempt = 0
+        while True:
+            try:
+                return self._generate(messages, system_prompt)
+            except self.retryable_errors as e:
+                if attempt >= self.max_retries:
+                    raise ProviderError(self.name, str(e)) from e
+                logger.warning("%s call failed (%s), retrying", self.name, e)
+                self._backoff(attempt)
+                attempt += 1
+            except Exception as e:
+                raise ProviderError(self.name, str(e)) from e
+
+    def stream(self, messages, system_prompt=SYSTEM_PROMPT):
+        """
+        Stream a response as it is generated.
+
+        Retries only happen before the first chunk has been yielded, so the
+        caller never sees duplicated text.
+
+        Args:
+            messages: List of message objects with 'role' and 'content' fields
+            system_prompt: Instructions for the model
+
+        Yields:
+            Text chunks of the AI's response, in order
+
+        Raises:
+            ProviderError: If the call fails
+        """
+        attempt = 0
+        while True:
+            started = False
+            try:
+                for text in self._stream(messages, system_prompt):
+                    started = True
+                    yield text
+                return
+            except self.retryable_errors as e:
+                if started or attempt >= self.max_retries:
+                    raise ProviderError(self.name, str(e)) from e
+                logger.warning("%s stream failed (%s), retrying", self.name, e)
+                self._backoff(attempt)
+                attempt += 1
+            except Exception as e:
+                raise ProviderError(self.name, str(e)) from e
+
+    def summarize(self, summary, messages):
+        """
+        Fold messages into a rolling conversation summary.
+
+        Args:
+            summary: The current summary text (may be empty)
+            messages: Messages to fold in, oldest first
+
+        Returns:
+            The updated summary text
+        """
+        prompt = build_summary_prompt(summary, messages)
+        return self.generate([{'role': 'user', 'content': prompt}], system_prompt=SUMMARY_INSTRUCTIONS).strip()
+
+
+class GeminiProvider(Provider):
+    """Google Gemini via google-generativeai."""
+
+    name = 'gemini'
+    default_model = 'gemini-1.5-pro'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        import google.generativeai as genai
+        from google.api_core import exceptions as google_exceptions
+
+        api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("No API key found. Please set GOOGLE_API_KEY in .env file")
+
+        # Configure once; the client and its channel are reused by every call.
+        # GEMINI_BASE_URL (e.g. a local mock server) switches to the REST transport.
+        base_url = os.environ.get("GEMINI_BASE_URL")
+        if base_url:
+            genai.configure(api_key=api_key, transport='rest', client_options={'api_endpoint': base_url})
+        else:
+            genai.configure(api_key=api_key)
+        self._genai = genai
+        self._models = {}
+        self._models_lock = threading.Lock()
+        self.retryable_errors = (
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.ResourceExhausted,
+            google_exceptions.InternalServerError,
+        )
+
+    def _get_model(self, system_prompt):
+        # One GenerativeModel per system prompt (chat and summarization)
+        with self._models_lock:
+            model = self._models.get(system_prompt)
+            if model is None:
+                model = self._genai.GenerativeModel(self.model, system_instruction=system_prompt)
+                self._models[system_prompt] = model
+            return model
+
+    @staticmethod
+    def format_messages(messages):
+        """Convert chat messages into Gemini's content format."""
+        formatted_messages = []
+        for msg in messages:
+            role = msg["role"]
+            content = msg["content"]
+
+            # Map OpenAI roles to Gemini roles
+            if role == "user":
+                formatted_messages.append({"role": "user", "parts": [content]})
+            elif role == "assistant":
+                formatted_messages.append({"role": "model", "parts": [content]})
+            elif role == "system":
+                # Context such as the rolling summary, acknowledged to keep turns alternating
+                formatted_messages.append({"role": "user", "parts": [content]})
+                formatted_messages.append({"role": "model", "parts": ["Understood."]})
+        return formatted_messages
+
+    def _generate(self, messages, system_prompt):
+        response = self._get_model(system_prompt).generate_content(
+            self.format_messages(messages),
+            request_options={'timeout': self.timeout},
+        )
+        return response.text
+
+    def _stream(self, messages, system_prompt):
+        response = self._get_model(system_prompt).generate_content(
+            self.format_messages(messages),
+            stream=True,
+            request_options={'timeout': self.timeout},
+        )
+        for chunk in response:
+            # Chunks without parts (e.g. safety metadata only) carry no text
+            if chunk.parts:
+                yield chunk.text
+
+
+class OpenAIProvider(Provider):
+    """OpenAI chat completions via the openai client."""
+
+    name = 'openai'
+    default_model = 'gpt-4o'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        import openai
+
+        # Retries are handled by Provider so they share the same policy
+        self._client = openai.OpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            base_url=os.environ.get("OPENAI_BASE_URL") or None,
+            timeout=self.timeout,
+            max_retries=0,
+        )
+        self.retryable_errors = (
+            openai.APITimeoutError,
+            openai.APIConnectionError,
+            openai.RateLimitError,
+            openai.InternalServerError,
+        )
+
+    def _request(self, messages, system_prompt, **kwargs):
+        return self._client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                *[{"role": msg["role"], "content": msg["content"]} for msg in messages]
+            ],
+            temperature=0.7,
+            max_tokens=2048,
+            **kwargs
+        )
+
+    def _generate(self, messages, system_prompt):
+        return self._request(messages, system_prompt).choices[0].message.content
+
+    def _stream(self, messages, system_prompt):
+        for chunk in self._request(messages, system_prompt, stream=True):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class FakeProvider(Provider):
+    """
+    Deterministic offline provider for development, tests and benchmarks.
+
+    The same messages always produce the same response. Latency before the
+    first token and streaming speed are configurable, so the app can be
+    exercised and load-tested without network access.
+    """
+
+    name = 'fake'
+    default_model = 'fake-1'
+
+    WORDS = ("the", "model", "response", "token", "stream", "latency", "cache", "request", "worker",
+             "context", "summary", "provider", "benchmark", "message", "conversation", "budget")
+
+    def __init__(self, latency=0.0, tokens_per_second=0.0, response_tokens=60, **kwargs):
+        """
+        Args:
+            latency: Seconds to wait before the first token
+            tokens_per_second: Streaming speed (0 means no delay between tokens)
+            response_tokens: Number of words in each response
+        """
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+
+    def _tokens(self, messages):
+        prompt = messages[-1]['content'] if messages else ''
+        seed = hashlib.sha256(prompt.encode('utf-8')).digest()
+        rng = random.Random(seed)
+
+        words = [rng.choice(self.WORDS) for _ in range(self.response_tokens)]
+        tokens = [f"Simulated reply to \"{prompt[:40]}\":\n\n"]
+        tokens.extend(word + " " for word in words)
+        tokens.append("\n\n```python\nprint(%r)\n```\n" % seed.hex()[:8])
+        return tokens
+
+    def _generate(self, messages, system_prompt):
+        tokens = self._tokens(messages)
+        delay = self.latency
+        if self.tokens_per_second:
+            delay += len(tokens) / self.tokens_per_second
+        time.sleep(delay)
+        return ''.join(tokens)
+
+    def _stream(self, messages, system_prompt):
+        time.sleep(self.latency)
+        for token in self._tokens(messages):
+            if self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            yield token
+
+
+PROVIDERS = {
+    'gemini': GeminiProvider,
+    'openai': OpenAIProvider,
+    'fake': FakeProvider,
+}
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def create_provider(name, **kwargs):
+    """
+    Create a provider from environment configuration.
+
+    <NAME>_MODEL (e.g. GEMINI_MODEL) selects the model; LLM_TIMEOUT and
+    LLM_MAX_RETRIES apply to every provider; FAKE_LLM_LATENCY, FAKE_LLM_TOKENS_PER_SEC and FAKE_LLM_RESPONSE_TOKENS
+    configure the fake provider. Keyword arguments override the environment.
+
+    Args:
+        name: Provider name ('gemini', 'openai' or 'fake')
+
+    Returns:
+        A new Provider instance
+    """
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider: {name}")
+
+    options = {
+        'model': os.environ.get(f'{name.upper()}_MODEL') or None,
+        'timeout': float(os.environ.get('LLM_TIMEOUT', '60')),
+        'max_retries': int(os.environ.get('LLM_MAX_RETRIES', '2')),
+    }
+    if name == 'fake':
+        options.update({
+            'latency': float(os.environ.get('FAKE_LLM_LATENCY', '0')),
+            'tokens_per_second': float(os.environ.get('FAKE_LLM_TOKENS_PER_SEC', '0')),
+            'response_tokens': int(os.environ.get('FAKE_LLM_RESPONSE_TOKENS', '60')),
+        })
+    options.update(kwargs)
+    return PROVIDERS[name](**options)
+
+
+def get_provider(name=None):
+    """
+    Return the shared provider instance, creating it on first use.
+
+    Args:
+        name: Provider name; defaults to the LLM_PROVIDER env var ('gemini')
+
+    Returns:
+        The process-wide Provider for that name
+    """
+    name = (name or os.environ.get('LLM_PROVIDER', 'gemini')).lower()
+    with _providers_lock:
+        if name not in _providers:
+            _providers[name] = create_provider(name)
+        return _providers[name]
@@ -0,0 +1,317 @@
+import os
+import time
+import math
+import uuid
+import threading
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is refused by admission control.
+
+    status is 429 for rate limits and 503 when the server is saturated;
+    retry_after is the number of seconds the client should wait.
+    """
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class LimiterBackend:
+    """
+    Storage for rate-limit state.
+
+    The in-process backend only limits a single worker. A shared backend
+    (e.g. Redis) makes the limits hold across every worker and host.
+    """
+
+    def take_token(self, key, rate, capacity):
+        """
+        Take one token from a token bucket.
+
+        Args:
+            key: Bucket identifier
+            rate: Refill rate in tokens per second
+            capacity: Maximum number of tokens (burst size)
+
+        Returns:
+            0 if a token was taken, otherwise seconds until one is available
+        """
+        raise NotImplementedError
+
+    def try_acquire(self, key, limit):
+        """
+        Take a concurrency slot if fewer than limit are in use.
+
+        Returns:
+            A holder token to pass to release(), or None if no slot is free
+        """
+        raise NotImplementedError
+
+    def release(self, key, holder):
+        """Return the slot taken with try_acquire() by holder. Unknown holders are ignored."""
+        raise NotImplementedError
+
+
+class MemoryLimiterBackend(LimiterBackend):
+    """In-process limiter state; limits apply per worker process."""
+
+    def __init__(self, max_buckets=100000):
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, updated_at, rate, capacity)
+        self._slots = {}  # key -> set of holder tokens
+
+    def take_token(self, key, rate, capacity):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at, _, _ = self._buckets.get(key, (capacity, now, rate, capacity))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now, rate, capacity)
+
+            # Buckets that have refilled carry no state worth keeping
+            if len(self._buckets) > self.max_buckets:
+                self._buckets = {k: v for k, v in self._buckets.items()
+                                 if v[0] + (now - v[1]) * v[2] < v[3]}
+            return wait
+
+    def try_acquire(self, key, limit):
+        with self._lock:
+            holders = self._slots.setdefault(key, set())
+            if len(holders) >= limit:
+                return None
+            holder = uuid.uuid4().hex
+            holders.add(holder)
+            return holder
+
+    def release(self, key, holder):
+        with self._lock:
+            self._slots.get(key, set()).discard(holder)
+
+
+class RedisLimiterBackend(LimiterBackend):
+    """Limiter state in Redis, shared by every worker. Requires the redis package."""
+
+    # Atomic token bucket: returns 0 when a token was taken, else ms to wait
+    TOKEN_BUCKET_SCRIPT = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 't'))
+local updated = tonumber(redis.call('HGET', KEYS[1], 'u'))
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+if tokens == nil then
+  tokens = capacity
+  updated = now
+end
+tokens = math.min(capacity, tokens + (now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 't', tokens, 'u', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return wait
+"""
+
+    # Atomic slot acquisition. Slots are members of a sorted set scored by when
+    # they were taken; slots older than the TTL are pruned first. Returns 1 if taken.
+    ACQUIRE_SLOT_SCRIPT = """
+local now = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - ttl)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+  return 0
+end
+redis.call('ZADD', KEYS[1], now, ARGV[2])
+redis.call('EXPIRE', KEYS[1], math.ceil(ttl))
+return 1
+"""
+
+    # Each slot expires on its own after this long, so slots leaked by a crashed
+    # worker are reclaimed; it must be longer than any generation
+    SLOT_TTL = 600
+
+    def __init__(self, url, prefix='ratelimit:'):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._take = self._redis.register_script(self.TOKEN_BUCKET_SCRIPT)
+        self._acquire = self._redis.register_script(self.ACQUIRE_SLOT_SCRIPT)
+
+    def take_token(self, key, rate, capacity):
+        wait_ms = self._take(keys=[self._prefix + key], args=[rate, capacity, time.time()])
+        return int(wait_ms) / 1000
+
+    def try_acquire(self, key, limit):
+        holder = uuid.uuid4().hex
+        taken = self._acquire(keys=[self._prefix + 'slots:' + key],
+                              args=[limit, holder, time.time(), self.SLOT_TTL])
+        return holder if taken else None
+
+    def release(self, key, holder):
+        self._redis.zrem(self._prefix + 'slots:' + key, holder)
+
+
+class GenerationSlot:
+    """A held concurrency slot. release() is idempotent."""
+
+    def __init__(self, controller, holder):
+        self._controller = controller
+        self._holder = holder
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self._holder)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    """
+    Admission control for model-calling requests.
+
+    check_rate() applies per-session and per-IP token buckets. acquire()
+    takes one of max_concurrent global generation slots; when none are free
+    the caller waits in a bounded queue for up to queue_timeout seconds.
+    New arrivals only take a slot directly when nobody is queued, so they
+    can't overtake waiting requests. A full queue or a timed-out wait is
+    rejected with 503 rather than piling up blocked workers.
+    """
+
+    SLOT_KEY = 'generations'
+
+    def __init__(self, backend, max_concurrent=64, max_queue=128, queue_timeout=10.0,
+                 session_rate=20, session_burst=5, ip_rate=60, ip_burst=20, retry_after=2):
+        """
+        Args:
+            backend: LimiterBackend holding bucket and slot state
+            max_concurrent: Generations allowed in flight at once
+            max_queue: Requests allowed to wait for a slot (per process)
+            queue_timeout: Seconds a request may wait for a slot
+            session_rate: Requests per minute per session
+            session_burst: Burst size per session
+            ip_rate: Requests per minute per client IP
+            ip_burst: Burst size per client IP
+            retry_after: Retry-After seconds suggested when saturated
+        """
+        self.backend = backend
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.retry_after = retry_after
+        self._condition = threading.Condition()
+        self.waiting = 0
+        self.in_flight = 0
+
+    def check_rate(self, session_key, ip):
+        """
+        Apply the per-session and per-IP rate limits.
+
+        Raises:
+            AdmissionRejected: With status 429 if either limit is exceeded
+        """
+        checks = (
+            ('session:' + session_key, self.session_rate, self.session_burst),
+            ('ip:' + ip, self.ip_rate, self.ip_burst),
+        )
+        for key, per_minute, burst in checks:
+            if not per_minute:
+                continue
+            wait = self.backend.take_token(key, per_minute / 60, burst)
+            if wait:
+                raise AdmissionRejected("Too many requests. Please slow down.", 429, wait)
+
+    def acquire(self):
+        """
+        Take a generation slot, waiting in the queue if necessary.
+
+        Returns:
+            GenerationSlot to release when the generation finishes
+
+        Raises:
+            AdmissionRejected: With status 503 if the queue is full or the wait times out
+        """
+        with self._condition:
+            if not self.waiting:
+                holder = self.backend.try_acquire(self.SLOT_KEY, self.max_concurrent)
+                if holder is not None:
+                    return self._admitted(holder)
+
+            if self.waiting >= self.max_queue:
+                raise AdmissionRejected("Server is busy. Please try again shortly.", 503, self.retry_after)
+            self.waiting += 1
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise AdmissionRejected("Server is busy. Please try again shortly.", 503,
+                                                self.retry_after)
+                    # Woken by local releases; the timeout also picks up slots freed by other workers
+                    self._condition.wait(min(remaining, 0.1))
+                    holder = self.backend.try_acquire(self.SLOT_KEY, self.max_concurrent)
+                    if holder is not None:
+                        return self._admitted(holder)
+            finally:
+                self.waiting -= 1
+
+    def _admitted(self, holder):
+        with self._condition:
+            self.in_flight += 1
+        return GenerationSlot(self, holder)
+
+    def _release(self, holder):
+        self.backend.release(self.SLOT_KEY, holder)
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+
+def admission_from_env():
+    """
+    Create the admission controller from environment configuration.
+
+    RATE_LIMIT_BACKEND selects 'memory' (default) or 'redis' (with REDIS_URL).
+    GENERATION_CONCURRENCY, GENERATION_QUEUE_SIZE, GENERATION_QUEUE_TIMEOUT,
+    SESSION_RATE_PER_MIN, SESSION_BURST, IP_RATE_PER_MIN and IP_BURST set the
+    limits; a rate of 0 disables that limiter.
+    """
+    backend_name = os.environ.get('RATE_LIMIT_BACKEND', 'memory').lower()
+    if backend_name == 'redis':
+        backend = RedisLimiterBackend(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+    elif backend_name == 'memory':
+        backend = MemoryLimiterBackend()
+    else:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend_name}")
+
+    return AdmissionController(
+        backend,
+        max_concurrent=int(os.environ.get('GENERATION_CONCURRENCY', '64')),
+        max_queue=int(os.environ.get('GENERATION_QUEUE_SIZE', '128')),
+        queue_timeout=float(os.environ.get('GENERATION_QUEUE_TIMEOUT', '10')),
+        session_rate=float(os.environ.get('SESSION_RATE_PER_MIN', '20')),
+        session_burst=int(os.environ.get('SESSION_BURST', '5')),
+        ip_rate=float(os.environ.get('IP_RATE_PER_MIN', '60')),
+        ip_burst=int(os.environ.get('IP_BURST', '20')),
+    )
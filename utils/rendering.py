@@ -0,0 +1,141 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Bump when the rendering pipeline changes so cached HTML (and ETags) are refreshed
+RENDER_VERSION = 1
+
+# CSS class on highlighted code blocks; static/css/highlight.css is generated for it
+CODE_CSS_CLASS = 'codehilite'
+
+ALLOWED_TAGS = {
+    'a', 'blockquote', 'br', 'code', 'del', 'div', 'em', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr',
+    'img', 'li', 'ol', 'p', 'pre', 'span', 'strong', 'table', 'tbody', 'td', 'th', 'thead', 'tr', 'ul',
+}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'img': {'src', 'alt', 'title'},
+    'td': {'align'},
+    'th': {'align'},
+    # Pygments marks tokens with classes only, never inline styles
+    'code': {'class'},
+    'div': {'class'},
+    'span': {'class'},
+}
+
+
+class MarkdownRenderer:
+    """
+    Renders assistant messages to sanitized, syntax-highlighted HTML.
+
+    Markdown is converted with Python-Markdown, code blocks are highlighted
+    by Pygments, and the result is cleaned with nh3 so model output can't
+    inject markup. Rendered HTML is kept in an LRU cache keyed by a hash of
+    the content, so each message is rendered once per worker rather than on
+    every page load.
+
+    Requires the markdown, pygments and nh3 packages; without them render()
+    returns None and the browser falls back to rendering markdown itself.
+    """
+
+    def __init__(self, max_entries=5000):
+        """
+        Args:
+            max_entries: Maximum number of rendered messages kept in memory
+        """
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        try:
+            import markdown
+            import nh3
+            import pygments  # noqa: F401 -- used by the codehilite extension
+        except ImportError as e:
+            logger.warning("Server-side markdown rendering disabled: %s", e)
+            self.available = False
+            return
+        self._markdown = markdown
+        self._nh3 = nh3
+        self.available = True
+
+    def _converter(self):
+        # Markdown instances keep per-document state, so each thread gets its own
+        converter = getattr(self._local, 'converter', None)
+        if converter is None:
+            converter = self._markdown.Markdown(
+                extensions=['fenced_code', 'tables', 'sane_lists', 'nl2br', 'codehilite'],
+                extension_configs={
+                    # Guessing the language of unlabelled blocks is slow and often wrong
+                    'codehilite': {'css_class': CODE_CSS_CLASS, 'guess_lang': False},
+                },
+            )
+            self._local.converter = converter
+        return converter
+
+    def _render(self, content):
+        converter = self._converter()
+        try:
+            html = converter.convert(content)
+        finally:
+            converter.reset()
+        return self._nh3.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES,
+                               link_rel='noopener noreferrer nofollow')
+
+    def render(self, content):
+        """
+        Return the sanitized HTML for a message's markdown content.
+
+        Returns:
+            HTML string, or None if server-side rendering is unavailable
+        """
+        if not self.available:
+            return None
+
+        key = hashlib.sha256(f"{RENDER_VERSION}:{content}".encode('utf-8')).hexdigest()
+        with self._lock:
+            html = self._cache.get(key)
+            if html is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        html = self._render(content)
+
+        with self._lock:
+            self._cache[key] = html
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+        return html
+
+    def stats(self):
+        """Return cache counters and the current number of entries."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._cache)}
+
+
+def renderer_from_env():
+    """
+    Create the markdown renderer from environment configuration.
+
+    SERVER_RENDERING=0 turns server-side rendering off; RENDER_CACHE_SIZE
+    sets the number of rendered messages cached per worker.
+
+    Returns:
+        A MarkdownRenderer, or None when server-side rendering is off
+    """
+    if os.environ.get('SERVER_RENDERING', '1').lower() in ('0', 'false', 'no', 'off'):
+        return None
+    return MarkdownRenderer(max_entries=int(os.environ.get('RENDER_CACHE_SIZE', '5000')))
@@ -0,0 +1,336 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+from utils.providers import SYSTEM_PROMPT, ProviderError
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_messages(messages):
+    """
+    Normalize messages so trivially different requests share a cache key.
+
+    Only role and content are kept; line endings are unified and surrounding
+    whitespace is stripped. Inner whitespace is preserved because it is
+    significant in code.
+    """
+    return [
+        {'role': msg['role'].lower(), 'content': msg['content'].replace('\r\n', '\n').strip()}
+        for msg in messages
+    ]
+
+
+def make_cache_key(provider, model, system_prompt, messages):
+    """Return a hex digest identifying a provider request."""
+    payload = json.dumps({
+        'provider': provider,
+        'model': model,
+        'system': system_prompt,
+        'messages': normalize_messages(messages),
+    }, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class _Flight:
+    """An upstream call in progress that other identical requests can wait on or follow."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        # Chunks streamed by the leader so far, replayed to followers that join late
+        self.chunks = []
+        self._changed = threading.Condition()
+
+    def add_chunk(self, text):
+        with self._changed:
+            self.chunks.append(text)
+            self._changed.notify_all()
+
+    def finish(self, value, error=None):
+        with self._changed:
+            self.value = value
+            self.error = error
+            self.done.set()
+            self._changed.notify_all()
+
+    def follow(self):
+        """Yield the leader's chunks so far, then each new one as it arrives, until the flight lands."""
+        index = 0
+        while True:
+            with self._changed:
+                while index == len(self.chunks) and not self.done.is_set():
+                    self._changed.wait()
+                chunks = self.chunks[index:]
+                finished = self.done.is_set()
+            index += len(chunks)
+            yield from chunks
+            if finished:
+                return
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of model responses, with an optional SQLite tier.
+
+    The memory tier holds at most max_entries responses; entries older than
+    ttl seconds are treated as misses. When db_path is set, responses are also
+    written to SQLite so they survive restarts and can be shared by workers on
+    the same host; memory misses fall through to it and promote hits.
+
+    Identical concurrent requests are coalesced (single-flight): the first
+    caller computes the response and the others wait for its result instead
+    of making their own upstream call.
+    """
+
+    def __init__(self, max_entries=1000, ttl=3600, db_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._flights = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses "
+                             "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self._db.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+
+    def _get_memory(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_memory(self, key, value, expires_at):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _get_disk(self, key, now):
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < now:
+            return None
+        return row
+
+    def get(self, key):
+        """Return the cached response for key, or None. Counts a hit or miss."""
+        now = time.time()
+        with self._lock:
+            value = self._get_memory(key, now)
+            if value is not None:
+                self.hits += 1
+                return value
+
+        row = self._get_disk(key, now)
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._set_memory(key, row[0], row[1])
+            return row[0]
+
+    def set(self, key, value):
+        """Store a response in every tier."""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._set_memory(key, value, expires_at)
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    self._db.execute("INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                                     (key, value, expires_at))
+                    self._db.commit()
+            except sqlite3.Error:
+                logger.exception("Failed to write response cache entry")
+
+    def _join_or_lead(self, key):
+        """Return (flight, is_leader) for key."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = _Flight()
+            self._flights[key] = flight
+            return flight, True
+
+    def _land(self, key, flight, value, error=None):
+        with self._lock:
+            self._flights.pop(key, None)
+        flight.finish(value, error)
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached response for key, computing and caching it on a miss.
+
+        Args:
+            key: Cache key from make_cache_key()
+            compute: Callable returning the response string
+
+        Returns:
+            The response string
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        flight, is_leader = self._join_or_lead(key)
+        if not is_leader:
+            flight.done.wait()
+            if flight.value is not None:
+                return flight.value
+            # The leader failed; make our own call
+            return compute()
+
+        value = None
+        try:
+            value = compute()
+            self.set(key, value)
+            return value
+        finally:
+            self._land(key, flight, value)
+
+    def stream_or_compute(self, key, stream):
+        """
+        Stream the response for key, serving it from the cache when possible.
+
+        A hit yields the whole response as a single chunk. On a miss the
+        chunks from stream() are passed through and the complete response is
+        cached once the stream finishes; an interrupted stream is not cached.
+        A coalesced request replays the chunks the first caller has received
+        so far and then follows its stream as it arrives.
+
+        Args:
+            key: Cache key from make_cache_key()
+            stream: Callable returning an iterator of text chunks
+
+        Yields:
+            Text chunks of the response
+
+        Raises:
+            ProviderError: If a coalesced request's leader fails after some of
+                its chunks were passed on
+        """
+        value = self.get(key)
+        if value is not None:
+            yield value
+            return
+
+        flight, is_leader = self._join_or_lead(key)
+        if not is_leader:
+            followed = False
+            for text in flight.follow():
+                followed = True
+                yield text
+            if flight.value is not None:
+                # A non-streaming leader only lands the complete response
+                if not followed:
+                    yield flight.value
+            elif not followed:
+                # The leader failed before any output; make our own call
+                yield from stream()
+            else:
+                raise flight.error or ProviderError('response cache', "The shared response was interrupted")
+            return
+
+        value = None
+        error = None
+        try:
+            chunks = []
+            for text in stream():
+                chunks.append(text)
+                flight.add_chunk(text)
+                yield text
+            value = ''.join(chunks)
+            self.set(key, value)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._land(key, flight, value, error)
+
+    def stats(self):
+        """Return hit/miss counters and the memory tier size."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+            }
+
+
+class CachedProvider:
+    """
+    Provider wrapper that serves repeated requests from a ResponseCache.
+
+    Exposes the same generate/stream/summarize interface as Provider.
+    """
+
+    def __init__(self, provider, cache):
+        self.provider = provider
+        self.cache = cache
+        self.name = provider.name
+        self.model = provider.model
+
+    def _key(self, messages, system_prompt):
+        return make_cache_key(self.provider.name, self.provider.model, system_prompt, messages)
+
+    def generate(self, messages, system_prompt=SYSTEM_PROMPT):
+        return self.cache.get_or_compute(
+            self._key(messages, system_prompt),
+            lambda: self.provider.generate(messages, system_prompt))
+
+    def stream(self, messages, system_prompt=SYSTEM_PROMPT):
+        return self.cache.stream_or_compute(
+            self._key(messages, system_prompt),
+            lambda: self.provider.stream(messages, system_prompt))
+
+    def summarize(self, summary, messages):
+        # Summaries are stored with the conversation already
+        return self.provider.summarize(summary, messages)
+
+
+def cache_from_env():
+    """
+    Create the response cache if RESPONSE_CACHE is enabled.
+
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL (seconds) and RESPONSE_CACHE_DB
+    (path of the optional SQLite tier) configure it.
+
+    Returns:
+        A ResponseCache, or None when caching is disabled
+    """
+    if os.environ.get('RESPONSE_CACHE', '').lower() not in ('1', 'true', 'yes', 'on'):
+        return None
+    return ResponseCache(
+        max_entries=int(os.environ.get('RESPONSE_CACHE_SIZE', '1000')),
+        ttl=float(os.environ.get('RESPONSE_CACHE_TTL', '3600')),
+        db_path=os.environ.get('RESPONSE_CACHE_DB') or None,
+    )
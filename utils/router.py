@@ -0,0 +1,410 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+from utils.providers import SYSTEM_PROMPT, SUMMARY_INSTRUCTIONS, ProviderError, build_summary_prompt
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker.
+
+    The circuit opens when failure_threshold failures happen within
+    failure_window seconds. While open, calls are refused; every
+    reset_timeout seconds one trial call is let through (half-open). A
+    successful trial closes the circuit and a failed one keeps it open.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+
+    def __init__(self, failure_threshold=5, failure_window=30.0, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = deque()
+        self._opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        return self.HALF_OPEN if self._trial else self.OPEN
+
+    def available(self):
+        """Return True if the circuit is closed or due a trial call."""
+        with self._lock:
+            return self._opened_at is None or time.monotonic() - self._opened_at >= self.reset_timeout
+
+    def allow(self):
+        """Return True if a call may be made now."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_timeout:
+                return False
+            # Let one trial through and restart the timer, so a trial that
+            # never reports back can't wedge the circuit
+            self._opened_at = now
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures.clear()
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        """Record a failed call. Returns True if this failure opened the circuit."""
+        now = time.monotonic()
+        with self._lock:
+            if self._opened_at is not None:
+                # Failed trial: stay open for another reset_timeout
+                self._opened_at = now
+                self._trial = False
+                return False
+
+            self._failures.append(now)
+            while self._failures and now - self._failures[0] > self.failure_window:
+                self._failures.popleft()
+            if len(self._failures) >= self.failure_threshold:
+                self._opened_at = now
+                self._failures.clear()
+                return True
+            return False
+
+
+class ProviderHealth:
+    """Rolling latency and error-rate statistics for one provider."""
+
+    def __init__(self, window=100):
+        """
+        Args:
+            window: Number of recent calls kept for each statistic
+        """
+        self._lock = threading.Lock()
+        # Time to the first chunk, kept separately for streamed and complete responses
+        self._latencies = {'stream': deque(maxlen=window), 'generate': deque(maxlen=window)}
+        self._outcomes = deque(maxlen=window)
+
+    def record_latency(self, mode, seconds):
+        with self._lock:
+            self._latencies[mode].append(seconds)
+
+    def record_outcome(self, ok):
+        with self._lock:
+            self._outcomes.append(ok)
+
+    def percentile(self, mode, q):
+        """Return the q-th quantile (0-1) of recent latencies, or None without samples."""
+        with self._lock:
+            samples = sorted(self._latencies[mode])
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def error_rate(self):
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return self._outcomes.count(False) / len(self._outcomes)
+
+
+class _Route:
+    """A provider with its health statistics and circuit breaker."""
+
+    def __init__(self, provider, health, breaker):
+        self.provider = provider
+        self.health = health
+        self.breaker = breaker
+
+
+class _Attempt:
+    """One in-flight provider call within a routed request."""
+
+    def __init__(self, index, route, mode):
+        self.index = index
+        self.route = route
+        self.mode = mode
+        self.started = time.monotonic()
+        self.cancelled = threading.Event()
+        self.running = True
+        self.answered = False
+        # Log fields recorded by the provider call, which runs in its own thread
+        self.fields = {}
+
+    @property
+    def name(self):
+        return self.route.provider.name
+
+    def report(self):
+        """Add the call's log fields to the current request."""
+        for name, value in self.fields.items():
+            metrics.record(name, value)
+
+    def first_chunk(self):
+        self.answered = True
+        self.route.health.record_latency(self.mode, time.monotonic() - self.started)
+
+    def succeeded(self):
+        self.running = False
+        self.route.health.record_outcome(True)
+        self.route.breaker.record_success()
+
+    def failed(self):
+        self.running = False
+        self.route.health.record_outcome(False)
+        if self.route.breaker.record_failure():
+            metrics.LLM_CIRCUIT_OPENS.inc(provider=self.name)
+            logger.warning("Circuit opened for provider %s", self.name)
+
+    def cancel(self):
+        self.running = False
+        self.cancelled.set()
+        if self.answered:
+            # Its time to first chunk is already recorded; how long the rest of
+            # the stream ran says nothing about latency
+            return
+        # The loser took at least this long; recording the lower bound keeps a
+        # consistently slow provider from looking fast just because it never finishes first
+        self.route.health.record_latency(self.mode, time.monotonic() - self.started)
+
+
+class ProviderRouter:
+    """
+    Routes generations across several providers by observed health.
+
+    Each call goes to the provider with the lowest expected latency
+    (median time to first chunk, inflated by its recent error rate);
+    providers whose circuit is open are skipped, and providers failing more
+    than unhealthy_error_rate of recent calls rank after healthy ones. If no chunk has arrived by
+    the primary's p95 latency, a hedged request is sent to the next
+    provider and whichever answers first wins; the other is abandoned. A
+    provider that fails before producing output fails over to the next
+    one. Exposes the same generate/stream/summarize interface as Provider.
+    """
+
+    def __init__(self, providers, hedge=True, hedge_quantile=0.95, min_hedge_delay=0.25,
+                 default_hedge_delay=5.0, failure_threshold=5, failure_window=30.0, reset_timeout=30.0,
+                 window=100, unhealthy_error_rate=0.5):
+        """
+        Args:
+            providers: Providers to route between, in order of preference
+            hedge: Whether to send hedged requests
+            hedge_quantile: Latency quantile of the primary after which to hedge
+            min_hedge_delay: Lower bound on the hedge delay in seconds
+            default_hedge_delay: Hedge delay before a provider has latency samples,
+                also used as its expected latency when ranking
+            failure_threshold: Failures within failure_window that open a circuit
+            failure_window: Seconds over which failures are counted
+            reset_timeout: Seconds an open circuit waits between trial calls
+            window: Number of recent calls used for latency and error rates
+            unhealthy_error_rate: Error rate above which a provider is only
+                tried after the healthy ones
+        """
+        if not providers:
+            raise ValueError("ProviderRouter needs at least one provider")
+        self.routes = [_Route(provider, ProviderHealth(window),
+                              CircuitBreaker(failure_threshold, failure_window, reset_timeout))
+                       for provider in providers]
+        self.name = '+'.join(provider.name for provider in providers)
+        self.model = '+'.join(provider.model for provider in providers)
+        self.models = [provider.model for provider in providers]
+        self.hedge = hedge and len(providers) > 1
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay = min_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.unhealthy_error_rate = unhealthy_error_rate
+
+    def _score(self, route, mode):
+        # A provider that fails fast never records a latency, so an unsampled one
+        # is assumed to be slow rather than instant
+        median = route.health.percentile(mode, 0.5)
+        if median is None:
+            median = self.default_hedge_delay
+        # Expected time to a successful answer if failures had to be retried
+        return median / (1 - min(route.health.error_rate(), 0.9))
+
+    def _ranked(self, mode):
+        # Closed circuits (and those due a trial) first, then healthy providers, then
+        # by score; ties keep the configured order
+        return sorted(self.routes, key=lambda route: (not route.breaker.available(),
+                                                      route.health.error_rate() > self.unhealthy_error_rate,
+                                                      self._score(route, mode)))
+
+    def _hedge_delay(self, route, mode):
+        latency = route.health.percentile(mode, self.hedge_quantile)
+        if latency is None:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, latency)
+
+    def _start(self, attempt, events, messages, system_prompt):
+        provider = attempt.route.provider
+
+        def run():
+            # The thread has no request context; the fields are reported back by _route()
+            metrics.capture_fields(attempt.fields)
+            try:
+                if attempt.mode == 'stream':
+                    chunks = provider.stream(messages, system_prompt)
+                    for text in chunks:
+                        if attempt.cancelled.is_set():
+                            chunks.close()
+                            return
+                        events.put((attempt.index, 'chunk', text))
+                else:
+                    # A blocking call can't be interrupted; if it loses, its result is dropped
+                    events.put((attempt.index, 'chunk', provider.generate(messages, system_prompt)))
+                events.put((attempt.index, 'done', None))
+            except Exception as e:
+                events.put((attempt.index, 'error', e))
+
+        threading.Thread(target=run, name=f"llm-{provider.name}", daemon=True).start()
+
+    def _route(self, mode, messages, system_prompt):
+        """Yield the response chunks of the first provider to start answering."""
+        candidates = self._ranked(mode)
+        events = queue.Queue()
+        attempts = []
+
+        def launch():
+            while candidates:
+                route = candidates.pop(0)
+                if route.breaker.allow():
+                    attempt = _Attempt(len(attempts), route, mode)
+                    attempts.append(attempt)
+                    self._start(attempt, events, messages, system_prompt)
+                    return attempt
+            return None
+
+        if launch() is None:
+            raise ProviderError(self.name, "All providers are unavailable (circuits open)")
+        hedge_at = time.monotonic() + self._hedge_delay(attempts[0].route, mode) if self.hedge else None
+
+        try:
+            # Wait for the first chunk from any attempt, hedging or failing over as needed
+            winner = None
+            while winner is None:
+                timeout = None
+                if hedge_at is not None and candidates:
+                    timeout = max(0.0, hedge_at - time.monotonic())
+                try:
+                    index, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    hedge_at = None
+                    hedged = launch()
+                    if hedged is not None:
+                        metrics.LLM_HEDGES.inc(provider=hedged.name)
+                        metrics.record('hedged', True)
+                    continue
+
+                attempt = attempts[index]
+                if kind == 'error':
+                    attempt.failed()
+                    attempt.report()
+                    logger.warning("Provider %s failed: %s", attempt.name, payload)
+                    if any(other.running for other in attempts):
+                        continue
+                    failover = launch()
+                    if failover is None:
+                        raise payload
+                    metrics.LLM_FAILOVERS.inc(provider=failover.name)
+                    if self.hedge:
+                        hedge_at = time.monotonic() + self._hedge_delay(failover.route, mode)
+                    continue
+
+                winner = attempt
+                winner.first_chunk()
+                metrics.record('routed_provider', winner.name)
+                for other in attempts:
+                    if other is not winner and other.running:
+                        other.cancel()
+                if kind == 'done':
+                    winner.succeeded()
+                    winner.report()
+                    return
+                yield payload
+
+            # Committed to one provider: text already sent can't be switched mid-response
+            while True:
+                index, kind, payload = events.get()
+                if index != winner.index:
+                    continue
+                if kind == 'chunk':
+                    yield payload
+                elif kind == 'done':
+                    winner.succeeded()
+                    winner.report()
+                    return
+                else:
+                    winner.failed()
+                    winner.report()
+                    raise payload
+
+        finally:
+            # Also runs when the client disconnects mid-stream
+            for attempt in attempts:
+                if attempt.running:
+                    attempt.cancel()
+
+    def generate(self, messages, system_prompt=SYSTEM_PROMPT):
+        """
+        Generate a complete response from the healthiest provider.
+
+        Raises:
+            ProviderError: If every eligible provider fails
+        """
+        return ''.join(self._route('generate', messages, system_prompt))
+
+    def stream(self, messages, system_prompt=SYSTEM_PROMPT):
+        """
+        Stream a response from the healthiest provider.
+
+        Raises:
+            ProviderError: If every eligible provider fails before answering,
+                or the chosen provider fails mid-stream
+        """
+        return self._route('stream', messages, system_prompt)
+
+    def summarize(self, summary, messages):
+        """Fold messages into a rolling conversation summary, routed like any other call."""
+        prompt = build_summary_prompt(summary, messages)
+        with metrics.timed('summarize'):
+            return self.generate([{'role': 'user', 'content': prompt}], system_prompt=SUMMARY_INSTRUCTIONS).strip()
+
+    def stats(self):
+        """Return the current health of each provider."""
+        return [{
+            'provider': route.provider.name,
+            'circuit': route.breaker.state,
+            'error_rate': route.health.error_rate(),
+            'p95_seconds': route.health.percentile('stream', 0.95),
+        } for route in self.routes]
+
+
+def router_from_env(providers):
+    """
+    Create a router over providers from environment configuration.
+
+    LLM_HEDGE (default 1) enables hedged requests; LLM_HEDGE_MIN_DELAY and
+    LLM_HEDGE_DEFAULT_DELAY bound the hedge delay. CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_FAILURE_WINDOW and CIRCUIT_RESET_TIMEOUT configure the breakers.
+    """
+    return ProviderRouter(
+        providers,
+        hedge=os.environ.get('LLM_HEDGE', '1').lower() not in ('0', 'false', 'no', 'off'),
+        min_hedge_delay=float(os.environ.get('LLM_HEDGE_MIN_DELAY', '0.25')),
+        default_hedge_delay=float(os.environ.get('LLM_HEDGE_DEFAULT_DELAY', '5')),
+        failure_threshold=int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', '5')),
+        failure_window=float(os.environ.get('CIRCUIT_FAILURE_WINDOW', '30')),
+        reset_timeout=float(os.environ.get('CIRCUIT_RESET_TIMEOUT', '30')),
+    )